@@ -63,8 +63,6 @@ result:
 
 """
 
-import os
-
 try:
     import streamlit.ReportThread as ReportThread
     from streamlit.server.Server import Server
@@ -73,7 +71,9 @@ except Exception:
     import streamlit.report_thread as ReportThread
     from streamlit.server.server import Server
 
-from src.data_utils import gather_data_artifacts, create_pickle
+from src.data_utils import gather_data_artifacts
+from src.artifact_cache import get_artifact_cache
+from src.artifact_store import ArtifactStore, write_data_artifacts
 
 
 class SessionState(object):
@@ -99,51 +99,43 @@ class SessionState(object):
 
     def _set_path_attributes(self):
 
-        ROOT_PATH = f"data/{self.img_option}"
+        if self.img_option == "custom":
+            ROOT_PATH = get_artifact_cache().entry_dir(self.cache_key)
+        else:
+            ROOT_PATH = f"data/{self.img_option}"
 
         self.img_option = self.img_option
         self.ROOT_PATH = ROOT_PATH
-        self.pkl_path = f"{ROOT_PATH}/{self.img_option}.pkl"
-
-    def _save_figure_images(self):
-
-        fig_paths = {}
-
-        # save feature map figure
-        fpn_img_path = os.path.join(self.ROOT_PATH, "fpn", "feature_map_fig.png")
-        fig_paths["fpn"] = fpn_img_path
-        self.data_artifacts["feature_map_fig"].savefig(
-            fpn_img_path, bbox_inches="tight"
-        )
-
-        # save anchor box figures
-        rpn = {}
-        for pyramid_level, data in self.data_artifacts["anchor_plots"].items():
-            rpn_img_path = os.path.join(self.ROOT_PATH, "rpn", f"{pyramid_level}.png")
-            rpn[pyramid_level] = rpn_img_path
-            data["fig"].savefig(rpn_img_path)
-
-        fig_paths["rpn"] = rpn
-
-        # save final prediction figures
-        nms = {}
-        for nms_setting, fig in self.data_artifacts["prediction_figures"].items():
-            nms_img_path = os.path.join(self.ROOT_PATH, "nms", f"{nms_setting}.png")
-            nms[nms_setting] = nms_img_path
-            fig.savefig(nms_img_path)
-
-        fig_paths["nms"] = nms
-
-        return fig_paths
 
     def _prepare_data_assets(self):
 
-        self.data_artifacts = gather_data_artifacts(img_path=self.img_path)
-        self.fig_paths = self._save_figure_images()
+        # uploads are cached by content, so a repeated image skips inference and
+        # reuses the artifacts already saved into its cache entry
+        if self.img_option == "custom":
+            cache = get_artifact_cache()
+            artifacts = cache.load(self.cache_key)
+            if artifacts is None:
+                artifacts = cache.store(
+                    self.cache_key,
+                    gather_data_artifacts(
+                        img_path=self.img_path, output_dir=self.ROOT_PATH
+                    ),
+                )
+        else:
+            artifacts = ArtifactStore(self.ROOT_PATH)
+            if not artifacts.exists():
+                artifacts = write_data_artifacts(
+                    gather_data_artifacts(
+                        img_path=self.img_path, output_dir=self.ROOT_PATH
+                    ),
+                    self.ROOT_PATH,
+                )
+
+        # pages load individual artifacts from the store as they need them
+        self.artifacts = artifacts
         self.has_detections = (
-            True if len(self.data_artifacts["outputs"]["boxes"]) > 0 else False
+            True if artifacts.load("summary")["num_detections"] > 0 else False
         )
-        self.data_artifacts.pop("outputs")
 
 
 def get(**kwargs):
@@ -50,7 +50,29 @@ import SessionState
 from app_pages import welcome, fpn, rpn, nms, references
 from src.model_utils import COCO_LABELS
 from src.app_utils import PRESET_IMAGES, APP_PAGES
-from src.data_utils import load_pickle
+from src.artifact_cache import get_artifact_cache
+
+
+def has_data_assets(session_state):
+    """
+    Checks whether the session already holds the artifact store of the selected
+    image. Opening a store is cheap, artifacts are only read by the pages.
+
+    """
+
+    artifacts = getattr(session_state, "artifacts", None)
+    return artifacts is not None and artifacts.root == session_state.ROOT_PATH
+
+
+def pin_cache_entry(session_state):
+    """
+    Marks the cache entry of an uploaded image as in use, so that cache eviction
+    triggered by other sessions does not remove the figures this session shows.
+
+    """
+
+    if getattr(session_state, "img_option", None) == "custom":
+        get_artifact_cache().pin(session_state.cache_key)
 
 
 def main():
@@ -65,6 +87,8 @@ def main():
         options=APP_PAGES,
     )
     session_state = SessionState.get()
+    if step_option != APP_PAGES[0]:
+        pin_cache_entry(session_state)
 
     if step_option == APP_PAGES[0]:
 
@@ -75,9 +99,7 @@ def main():
 
         with st.spinner("Hang tight while your image is processed!"):
 
-            if (session_state.img_option not in PRESET_IMAGES.keys()) and (
-                not hasattr(session_state, "data_artifacts")
-            ):
+            if not has_data_assets(session_state):
                 session_state._prepare_data_assets()
 
                 if not session_state.has_detections:
@@ -86,22 +108,20 @@ def main():
                         Please refresh your browser and try another image that contains one of the following classes: \
                         \n\n {', '.join([label for label in COCO_LABELS if label not in ['N/A', '__background__']])}"
                     )
-            else:
-                session_state = load_pickle(session_state.pkl_path)
 
         fpn(session_state)
 
     elif step_option == APP_PAGES[2]:
 
-        if session_state.img_option in PRESET_IMAGES.keys():
-            session_state = load_pickle(session_state.pkl_path)
+        if not has_data_assets(session_state):
+            session_state._prepare_data_assets()
 
         rpn(session_state)
 
     elif step_option == APP_PAGES[3]:
 
-        if session_state.img_option in PRESET_IMAGES.keys():
-            session_state = load_pickle(session_state.pkl_path)
+        if not has_data_assets(session_state):
+            session_state._prepare_data_assets()
 
         nms(session_state)
 
@@ -111,4 +131,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -40,12 +40,11 @@
 
 import os
 import sys
-import shutil
 import streamlit as st
 from PIL import Image
 
-from src.app_utils import get_feature_map_plot
-from src.data_utils import create_directory_structure
+from src.artifact_cache import bytes_sha256, find_preset, get_artifact_cache
+from src.artifact_cache import cache_key as artifact_cache_key
 
 
 def welcome(session_state, preset_images):
@@ -135,26 +134,21 @@ def welcome(session_state, preset_images):
                     img = Image.open(uploaded_image)
                     st.image(img, caption="Uploaded Image")
 
-                    # create folder directory to hold assets
-                    img_option = "custom"
-                    parent_dir = f"data/{img_option}"
+                    # uploads identical to a preset reuse its precomputed assets,
+                    # others are looked up in the content-addressed artifact cache
+                    image_hash = bytes_sha256(uploaded_image.getvalue())
+                    preset_option = find_preset(image_hash, preset_images)
 
-                    if os.path.exists(parent_dir):
-                        shutil.rmtree(parent_dir)
+                    if preset_option is not None:
+                        session_state.img_option = preset_option
+                        session_state.img_path = preset_images[preset_option]
+                    else:
+                        cache_key = artifact_cache_key(image_hash)
+                        img_path = get_artifact_cache().prepare_entry(cache_key, img)
 
-                    create_directory_structure(img_option)
-
-                    # save image to directory
-                    file_type = uploaded_image.name.split(".")[-1]
-
-                    if file_type == "png":
-                        img = img.convert("RGB")
-
-                    img_path = f"data/{img_option}/{img_option}.jpg"
-                    img.save(img_path, "jpeg")
-
-                    session_state.img_option = img_option
-                    session_state.img_path = img_path
+                        session_state.img_option = "custom"
+                        session_state.img_path = img_path
+                        session_state.cache_key = cache_key
 
         st.info(
             "After selecting an image, use the navigation drop down menu in the top left sidebar to advance to the next page: ***1. Feature Extraction***"
@@ -223,7 +217,7 @@ def fpn(session_state):
             maintain higher resolution, but semantically weaker attributes which are useful for detecting small objects. In contrast, feature maps from the final pyramid level \
             (P7) hold much lower resolution, but semantically stronger activations, making them effective for capturing larger objects."
         )
-        st.image(session_state.fig_paths["fpn"], use_column_width="auto")
+        st.image(session_state.artifacts.figure_path("fpn"), use_column_width="auto")
 
     return
 
@@ -289,7 +283,7 @@ def rpn(session_state):
             options=[f"P{i+3}" for i in range(5)],
         )
 
-        stats = session_state.data_artifacts["anchor_plots"][pyramid_level]["fig_stats"]
+        stats = session_state.artifacts.load("anchor_stats")[pyramid_level]
 
         col1, col2 = st.beta_columns(2)
         with col1:
@@ -298,10 +292,10 @@ def rpn(session_state):
             )
         with col2:
             st.info(
-                f'**Anchor Sizes:** {stats["anchor_sizes"]} px$^2$ \n\n **Anchor Stride:** ({" x ".join([str(stat) for stat in stats["stride"]])}) px'
+                f'**Anchor Sizes:** {tuple(stats["anchor_sizes"])} px$^2$ \n\n **Anchor Stride:** ({" x ".join([str(stat) for stat in stats["stride"]])}) px'
             )
 
-        st.image(session_state.fig_paths["rpn"][pyramid_level])
+        st.image(session_state.artifacts.figure_path(f"rpn/{pyramid_level}"))
 
     return
 
@@ -319,10 +313,7 @@ def nms(session_state):
     total_anchors = sum(
         [
             grid["grid_size"][0] * grid["grid_size"][1] * 9
-            for grid in [
-                session_state.data_artifacts["anchor_plots"][f"P{i+3}"]["fig_stats"]
-                for i in range(5)
-            ]
+            for grid in session_state.artifacts.load("anchor_stats").values()
         ]
     )
 
@@ -374,10 +365,11 @@ def nms(session_state):
 
         if nms_checkbox:
             st.image(
-                session_state.fig_paths["nms"]["with_nms"], use_column_width="auto"
+                session_state.artifacts.figure_path("nms/with_nms"),
+                use_column_width="auto",
             )
         else:
-            st.image(session_state.fig_paths["nms"]["without_nms"])
+            st.image(session_state.artifacts.figure_path("nms/without_nms"))
 
     return
 
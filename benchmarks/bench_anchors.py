@@ -0,0 +1,135 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Measures the time and memory AnchorGenerator.forward spends on anchors for
+batches of padded images, against the previous behaviour of concatenating a
+fresh copy of every level's anchors for each image in the batch.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_anchors.py --batch-sizes 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+from torchvision.models.detection.image_list import ImageList
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retinanet import retinanet_resnet50_fpn
+
+
+def unique_bytes(tensors):
+    """Sums the storage held by a list of tensors, counting shared storages once"""
+
+    storages = {t.storage().data_ptr(): t.storage() for t in tensors}
+    return sum(s.size() * s.element_size() for s in storages.values())
+
+
+def per_image_copies(anchor_generator, image_list, features):
+    """The previous forward pass: regenerate, then one torch.cat per image"""
+
+    grid_sizes = [feature_map.shape[-2:] for feature_map in features]
+    strides = anchor_generator.compute_strides(
+        image_list.tensors.shape[-2:], grid_sizes
+    )
+    anchor_generator.set_cell_anchors(features[0].dtype, features[0].device)
+    anchors_over_all_feature_maps = anchor_generator.grid_anchors(grid_sizes, strides)
+    return [
+        torch.cat(anchors_over_all_feature_maps)
+        for _ in range(len(image_list.image_sizes))
+    ]
+
+
+def time_fn(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        timings.append(time.perf_counter() - start)
+    return out, np.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--width", type=int, default=1216)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    model = retinanet_resnet50_fpn(pretrained=False, pretrained_backbone=False)
+    anchor_generator = model.anchor_generator
+    grid_sizes = model.feature_grid_sizes((args.height, args.width))
+
+    print(
+        f"{'batch':>5} {'before MB':>10} {'after MB':>10} {'before ms':>10} {'after ms':>10}"
+    )
+    for batch_size in args.batch_sizes:
+        image_list = ImageList(
+            torch.empty(batch_size, 3, args.height, args.width),
+            [(args.height, args.width)] * batch_size,
+        )
+        features = [torch.empty(batch_size, 1, h, w) for h, w in grid_sizes]
+
+        before, before_ms = time_fn(
+            lambda: per_image_copies(anchor_generator, image_list, features),
+            args.repeats,
+        )
+        after, after_ms = time_fn(
+            lambda: anchor_generator(image_list, features), args.repeats
+        )
+
+        assert all(torch.equal(b, a) for b, a in zip(before, after))
+        print(
+            f"{batch_size:>5} {unique_bytes(before) / 2 ** 20:>10.1f} "
+            f"{unique_bytes(after) / 2 ** 20:>10.1f} {before_ms:>10.2f} {after_ms:>10.2f}"
+        )
+
+    print(f"anchor cache: {anchor_generator.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares the CPU execution modes of the model registry on the preset images (or
+the given images): fp32 in NCHW, fp32 in channels_last, and bfloat16 autocast in
+either layout when the installed torch supports CPU autocast.
+
+Detections of the fp32 NCHW model above --gt-threshold act as pseudo ground truth,
+and every mode is scored against them with the mAP of bench_presets.py. The table
+also reports the largest difference between the top-k scores of each image, which
+stays near zero for channels_last since only the layout changes.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_cpu_modes.py --preset fast --repeats 3
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_presets import mean_average_precision, run_preset
+from src.app_utils import PRESET_IMAGES
+from src.model_registry import get_model
+from src.retinanet import RESOLUTION_PRESETS, cpu_autocast_supported
+from src.pipeline_utils import iter_image_paths, decode_image
+
+CPU_MODES = [
+    ("fp32", {}),
+    ("channels_last", {"channels_last": True}),
+    ("bf16", {"autocast_dtype": torch.bfloat16}),
+    ("channels_last+bf16", {"channels_last": True, "autocast_dtype": torch.bfloat16}),
+]
+
+
+def top_score_difference(detections, reference, k=10):
+    """
+    Largest difference between the k best scores of each image, ranked by score
+    on both sides since postprocessing returns detections grouped by class. Images
+    with fewer detections compare as many as both sides have.
+    """
+
+    differences = []
+    for det, ref in zip(detections, reference):
+        num = min(k, len(det["scores"]), len(ref["scores"]))
+        if num == 0:
+            continue
+        det_top = det["scores"].sort(descending=True)[0][:num]
+        ref_top = ref["scores"].sort(descending=True)[0][:num]
+        differences.append(float((det_top - ref_top).abs().max()))
+    return max(differences, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "inputs", nargs="*", help="image files, directories or .txt file lists"
+    )
+    parser.add_argument("--preset", choices=list(RESOLUTION_PRESETS), default="full")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--detection-threshold", type=float, default=0.05)
+    parser.add_argument(
+        "--gt-threshold",
+        type=float,
+        default=0.5,
+        help="score above which fp32 detections count as ground truth",
+    )
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    img_paths = list(iter_image_paths(args.inputs or list(PRESET_IMAGES.values())))
+    images = [decode_image(path) for path in img_paths]
+
+    modes = CPU_MODES
+    if not cpu_autocast_supported():
+        print(f"torch {torch.__version__} has no CPU autocast, skipping bf16 modes")
+        modes = [
+            (name, kwargs)
+            for name, kwargs in CPU_MODES
+            if not kwargs.get("autocast_dtype")
+        ]
+
+    results = {}
+    for name, kwargs in modes:
+        model = get_model(preset=args.preset, **kwargs)
+        timings, detections = run_preset(
+            model, images, None, args.repeats, args.detection_threshold
+        )
+        results[name] = {"timings": timings, "detections": detections}
+
+    reference = results["fp32"]["detections"]
+    ground_truths = [
+        {k: det[k][det["scores"] > args.gt_threshold] for k in ["boxes", "labels"]}
+        for det in reference
+    ]
+    num_gt = sum(len(gt["boxes"]) for gt in ground_truths)
+    print(
+        f"preset {args.preset}, {len(images)} images, {num_gt} fp32 detections above "
+        f"{args.gt_threshold} used as ground truth"
+    )
+
+    fp32_p50 = np.median(results["fp32"]["timings"])
+    print(f"{'mode':>20} {'p50 ms':>9} {'speedup':>8} {'mAP':>7} {'max dscore':>11}")
+    for name, result in results.items():
+        p50 = np.median(result["timings"])
+        map_score = mean_average_precision(
+            result["detections"], ground_truths, args.iou
+        )
+        map_text = "n/a" if map_score is None else f"{map_score:.3f}"
+        print(
+            f"{name:>20} {p50:9.1f} {fp32_p50 / p50:7.2f}x {map_text:>7} "
+            f"{top_score_difference(result['detections'], reference):11.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares the regular RetinaNetHead against FusedRetinaNetHead, with and without
+packing the P5-P7 levels, on FPN features of a padded image of the given size.
+
+For every variant it checks that the outputs match the regular head and reports
+latency, the number of operators launched and the bytes allocated by those
+operators, as measured by the autograd profiler.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_head.py --height 800 --width 1216 --batch-size 1
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retinanet import FusedRetinaNetHead, retinanet_resnet50_fpn
+
+
+def profile_head(head, features):
+    """Returns the number of operators run and the bytes they allocated"""
+
+    with torch.autograd.profiler.profile(profile_memory=True) as prof:
+        head(features)
+    events = [e for e in prof.function_events if e.cpu_parent is None]
+    allocated = sum(max(e.cpu_memory_usage, 0) for e in events)
+    return len(events), allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--width", type=int, default=1216)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    torch.manual_seed(0)
+
+    model = retinanet_resnet50_fpn(pretrained=False, pretrained_backbone=False).eval()
+    # the default init gives near constant outputs, which would hide mistakes
+    for param in model.head.parameters():
+        param.normal_(0, 0.02)
+
+    grid_sizes = model.feature_grid_sizes((args.height, args.width))
+    features = [torch.randn(args.batch_size, 256, h, w) for h, w in grid_sizes]
+
+    reference = model.head(features)
+    variants = [
+        ("head", model.head),
+        ("fused", FusedRetinaNetHead(model.head, pack_levels=None)),
+        ("fused + packed P5-P7", FusedRetinaNetHead(model.head, pack_levels=(2, 3, 4))),
+    ]
+
+    print(
+        f"features {[tuple(f.shape[-2:]) for f in features]}, batch {args.batch_size}"
+    )
+    print(f"{'variant':>22} {'median ms':>10} {'min ms':>9} {'ops':>6} {'alloc MB':>9}")
+    for name, head in variants:
+        outputs = head(features)
+        for key in reference:
+            assert torch.allclose(
+                outputs[key], reference[key], atol=1e-5
+            ), f"{name}: {key} differs from RetinaNetHead"
+
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            head(features)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        num_ops, allocated = profile_head(head, features)
+        print(
+            f"{name:>22} {np.median(timings):10.1f} {np.min(timings):9.1f} "
+            f"{num_ops:6d} {allocated / 2**20:9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares the eager PyTorch backbone and head against the ONNX Runtime backend on
+the preset images (or the given images), with anchors and postprocessing in
+PyTorch for both.
+
+It checks that both backends return the same detections at every resolution
+preset, then reports throughput in images/second for each backend and batch size.
+Requires onnx and onnxruntime.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_onnx.py --onnx retinanet.onnx --batch-sizes 1 4
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_postprocess import check_parity
+from src.app_utils import PRESET_IMAGES
+from src.model_registry import get_model
+from src.model_utils import predict_batch
+from src.retinanet import RESOLUTION_PRESETS
+from src.export_utils import export_onnx, OnnxRuntimeBackend
+from src.pipeline_utils import iter_image_paths, decode_image
+
+
+def throughput(model, images, batch_size, backend, preset, repeats):
+    # warm up the anchor cache and the runtime's memory arenas
+    predict_batch(model, images[:1], None, 0.0, preset=preset, backend=backend)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict_batch(
+            model,
+            images,
+            None,
+            0.0,
+            batch_size=batch_size,
+            preset=preset,
+            backend=backend,
+        )
+    return repeats * len(images) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("inputs", nargs="*", help="image files or directories")
+    parser.add_argument(
+        "--onnx", default=None, help="exported graph, exported to a temp file if unset"
+    )
+    parser.add_argument("--preset", choices=list(RESOLUTION_PRESETS), default="full")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    model = get_model()
+    onnx_path = args.onnx
+    if onnx_path is None:
+        onnx_path = os.path.join(os.environ.get("TMPDIR", "/tmp"), "retinanet.onnx")
+        export_onnx(model, onnx_path)
+    backend = OnnxRuntimeBackend(onnx_path, num_threads=args.threads)
+
+    img_paths = list(iter_image_paths(args.inputs or list(PRESET_IMAGES.values())))
+    images = [decode_image(path) for path in img_paths]
+
+    for preset in RESOLUTION_PRESETS:
+        check_parity(
+            predict_batch(model, images, None, 0.0, batch_size=1, preset=preset),
+            predict_batch(
+                model, images, None, 0.0, batch_size=1, preset=preset, backend=backend
+            ),
+            atol=args.atol,
+        )
+    print(f"parity ok on {len(images)} images at presets {list(RESOLUTION_PRESETS)}")
+
+    print(f"preset {args.preset}, {os.path.basename(onnx_path)}")
+    print(f"{'backend':>12} {'batch':>6} {'images/s':>9}")
+    for batch_size in args.batch_sizes:
+        for name, image_backend in [("pytorch", None), ("onnxruntime", backend)]:
+            rate = throughput(
+                model, images, batch_size, image_backend, args.preset, args.repeats
+            )
+            print(f"{name:>12} {batch_size:6d} {rate:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
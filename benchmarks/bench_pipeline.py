@@ -0,0 +1,401 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Times every stage of the RetinaNet inference path on CPU against the images in
+data/, for a range of input resolutions and batch sizes:
+
+    decode_resize         Image.open + full-size resize, as in get_inference_artifacts
+    transform             GeneralizedRCNNTransform normalize/resize/batch
+    backbone              ResNet-50-FPN
+    head                  RetinaNetHead classification and regression
+    anchors               AnchorGenerator, served from its cache after the first pass
+    postprocess           RetinaNet.postprocess_detections
+    transform_postprocess boxes mapped back to the original image sizes
+    figures               app figures saved as PNGs by render_figures (batch size 1 only)
+
+Results hold p50/p90/p99 latency per stage plus peak RSS per configuration and can
+be saved as a JSON baseline and compared against later runs.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_pipeline.py --save benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import platform
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_utils import COCO_LABELS, threshold_outputs
+from src.model_registry import resident_memory_bytes
+from src.retinanet import retinanet_resnet50_fpn
+from src.app_utils import (
+    FigureTask,
+    render_figures,
+    to_numpy,
+    sample_feature_maps,
+    plot_feature_samples,
+    get_anchor_plot_inputs,
+    plot_pyramid_level_anchors,
+    plot_predictions,
+)
+
+STAGES = [
+    "decode_resize",
+    "transform",
+    "backbone",
+    "head",
+    "anchors",
+    "postprocess",
+    "transform_postprocess",
+    "figures",
+]
+
+
+def reset_peak_rss():
+    """Resets the kernel's peak RSS counter (VmHWM) for this process, if allowed"""
+
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resident_memory_bytes()
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    def time(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.timings[stage].append((time.perf_counter() - start) * 1000)
+        return out
+
+    def summary(self):
+        return {
+            stage: {
+                "p50_ms": float(np.percentile(timings, 50)),
+                "p90_ms": float(np.percentile(timings, 90)),
+                "p99_ms": float(np.percentile(timings, 99)),
+                "mean_ms": float(np.mean(timings)),
+                "n": len(timings),
+            }
+            for stage, timings in self.timings.items()
+        }
+
+
+def decode_resize(img_path, model, to_tensor):
+    """Mirrors the image handling in get_inference_artifacts"""
+
+    img = Image.open(img_path).convert("RGB")
+    full_size = model.transform(to_tensor(img).unsqueeze(0))[0].tensors.size()[2:][::-1]
+    return img.resize(full_size)
+
+
+def build_figures(image, anchor_generator, outputs, features, output_dir, num_workers):
+    """Mirrors the figure rendering in gather_data_artifacts"""
+
+    tasks = [
+        FigureTask(
+            name="fpn",
+            plot_fn=plot_feature_samples,
+            kwargs={"samples": sample_feature_maps(features, 7)},
+            path=os.path.join(output_dir, "feature_map_fig.png"),
+            savefig_kwargs={"bbox_inches": "tight"},
+        )
+    ]
+    for i, kwargs in enumerate(
+        get_anchor_plot_inputs(image, anchor_generator, outputs["boxes"], features)
+    ):
+        tasks.append(
+            FigureTask(
+                name=f"P{i+3}",
+                plot_fn=plot_pyramid_level_anchors,
+                kwargs=kwargs,
+                path=os.path.join(output_dir, f"P{i+3}.png"),
+                savefig_kwargs={},
+            )
+        )
+    for nms_off in [False, True]:
+        tasks.append(
+            FigureTask(
+                name=f"nms_off={nms_off}",
+                plot_fn=plot_predictions,
+                kwargs={
+                    "image": image,
+                    "outputs": {k: to_numpy(v) for k, v in outputs.items()},
+                    "label_map": COCO_LABELS,
+                    "nms_off": nms_off,
+                },
+                path=os.path.join(output_dir, f"nms_off={nms_off}.png"),
+                savefig_kwargs={},
+            )
+        )
+
+    return render_figures(tasks, num_workers=num_workers)
+
+
+def run_pipeline(model, img_paths, timer, with_figures, figure_workers=None):
+    to_tensor = transforms.ToTensor()
+
+    pil_images = [
+        timer.time("decode_resize", decode_resize, p, model, to_tensor)
+        for p in img_paths
+    ]
+    images = [to_tensor(img) for img in pil_images]
+    original_image_sizes = [tuple(img.shape[-2:]) for img in images]
+
+    image_list, _ = timer.time("transform", model.transform, images)
+    features = timer.time("backbone", model.backbone, image_list.tensors)
+    features = list(features.values())
+    head_outputs = timer.time("head", model.head, features)
+    anchors = timer.time("anchors", model.anchor_generator, image_list, features)
+
+    num_anchors_per_level = [
+        x.size(2) * x.size(3) * model.anchor_generator.num_anchors_per_location()[0]
+        for x in features
+    ]
+    detections = timer.time(
+        "postprocess",
+        model.postprocess_detections,
+        head_outputs,
+        anchors,
+        image_list.image_sizes,
+        num_anchors_per_level,
+    )
+    detections = timer.time(
+        "transform_postprocess",
+        model.transform.postprocess,
+        detections,
+        image_list.image_sizes,
+        original_image_sizes,
+    )
+
+    if with_figures:
+        outputs = threshold_outputs(detections[0], 0.7)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            timer.time(
+                "figures",
+                build_figures,
+                np.asarray(pil_images[0]),
+                model.anchor_generator,
+                outputs,
+                features,
+                output_dir,
+                figure_workers,
+            )
+
+
+def run_benchmarks(args):
+    torch.set_grad_enabled(False)
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+
+    img_paths = sorted(
+        p
+        for p in glob.glob(os.path.join(args.data_dir, "*", "*.jpg"))
+        if "custom" not in p
+    )
+    if not img_paths:
+        raise FileNotFoundError(f"No images found under {args.data_dir}/*/")
+
+    model = retinanet_resnet50_fpn(
+        pretrained=not args.random_weights, pretrained_backbone=False
+    ).eval()
+
+    results = {
+        "meta": {
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "platform": platform.platform(),
+            "images": img_paths,
+            "random_weights": args.random_weights,
+        },
+        "configs": {},
+    }
+
+    for min_size in args.sizes:
+        model.transform.min_size = (min_size,)
+        model.transform.max_size = int(round(min_size * 1333 / 800))
+
+        for batch_size in args.batch_sizes:
+            name = f"size{min_size}_batch{batch_size}"
+            timer = StageTimer()
+            reset_peak_rss()
+
+            for iteration in range(args.warmup + args.iterations):
+                if iteration == args.warmup:
+                    timer.timings.clear()
+                batch_paths = [
+                    img_paths[(iteration * batch_size + i) % len(img_paths)]
+                    for i in range(batch_size)
+                ]
+                run_pipeline(
+                    model,
+                    batch_paths,
+                    timer,
+                    with_figures=batch_size == 1 and not args.skip_figures,
+                    figure_workers=args.figure_workers,
+                )
+
+            summary = timer.summary()
+            summary["total_p50_ms"] = sum(s["p50_ms"] for s in summary.values())
+            summary["peak_rss_mb"] = peak_rss_bytes() / 2**20
+            results["configs"][name] = summary
+            print_config(name, summary)
+
+    return results
+
+
+def print_config(name, summary):
+    print(f"\n{name}  (peak RSS {summary['peak_rss_mb']:.0f} MB)")
+    print(f"  {'stage':<22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for stage in STAGES:
+        if stage in summary:
+            s = summary[stage]
+            print(
+                f"  {stage:<22}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+            )
+    print(f"  {'total (p50)':<22}{summary['total_p50_ms']:>10.1f}")
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    Prints the p50 change of every stage against a saved baseline and returns the
+    list of stages that slowed down by more than tolerance and min_delta_ms
+    """
+
+    regressions = []
+    print(f"\ncomparison against baseline (tolerance {tolerance:.0%})")
+    for name, summary in results["configs"].items():
+        if name not in baseline["configs"]:
+            continue
+        for stage in STAGES:
+            if stage not in summary or stage not in baseline["configs"][name]:
+                continue
+            before = baseline["configs"][name][stage]["p50_ms"]
+            after = summary[stage]["p50_ms"]
+            change = (after - before) / max(before, 1e-6)
+            slower = change > tolerance and after - before > min_delta_ms
+            flag = "REGRESSION" if slower else ""
+            print(
+                f"  {name:<18}{stage:<22}{before:>9.1f} -> {after:>9.1f} ms "
+                f"({change:+.0%}) {flag}"
+            )
+            if flag:
+                regressions.append((name, stage))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 800])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--torch-threads", type=int, default=None)
+    parser.add_argument("--skip-figures", action="store_true")
+    parser.add_argument(
+        "--figure-workers",
+        type=int,
+        default=None,
+        help="figure rendering processes, 0 renders in the benchmark process",
+    )
+    parser.add_argument(
+        "--random-weights",
+        action="store_true",
+        help="skip loading the COCO weights; latency is unaffected but detections are empty",
+    )
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="ignore slowdowns smaller than this, which are usually timer noise",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nsaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
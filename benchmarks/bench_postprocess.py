@@ -0,0 +1,216 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Benchmarks RetinaNet.postprocess_detections against the original per-class loop
+(RetinaNet.postprocess_detections_per_class) on synthetic head outputs and checks
+that both produce the same boxes, scores and labels. The reference loop has no
+per-level candidate cap, so parity is checked with topk_candidates disabled and the
+capped configuration is timed separately.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_postprocess.py --height 800 --width 1216
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retinanet import retinanet_resnet50_fpn
+
+
+def make_head_outputs(model, height, width, logit_mean, logit_std, seed=0):
+    """
+    Builds synthetic head outputs and anchors for a padded image of the given size.
+
+    Logits are drawn around a strongly negative mean so that, like real outputs,
+    only a small fraction of (anchor, class) pairs clear the score threshold.
+    """
+
+    generator = torch.Generator().manual_seed(seed)
+
+    grid_sizes = []
+    size = (height, width)
+    for level in range(1, 8):
+        size = (int(np.ceil(size[0] / 2)), int(np.ceil(size[1] / 2)))
+        if level >= 3:
+            grid_sizes.append(size)
+
+    features = [torch.empty(1, 1, h, w) for h, w in grid_sizes]
+    image_list = type("ImageList", (), {})()
+    image_list.tensors = torch.empty(1, 3, height, width)
+    image_list.image_sizes = [(height, width)]
+    anchors = model.anchor_generator(image_list, features)
+
+    num_anchors = anchors[0].shape[0]
+    num_classes = model.head.classification_head.num_classes
+    num_anchors_per_level = [
+        h * w * model.anchor_generator.num_anchors_per_location()[0]
+        for h, w in grid_sizes
+    ]
+
+    head_outputs = {
+        "cls_logits": torch.randn(1, num_anchors, num_classes, generator=generator)
+        * logit_std
+        + logit_mean,
+        "bbox_regression": torch.randn(1, num_anchors, 4, generator=generator) * 0.1,
+    }
+
+    return head_outputs, anchors, [(height, width)], num_anchors_per_level
+
+
+def time_fn(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        timings.append(time.perf_counter() - start)
+    return out, np.array(timings) * 1000
+
+
+def canonical_order(detections):
+    """
+    Sorts detections by label, score and box so that boxes with exactly tied
+    scores compare equal regardless of which order NMS visited them in
+    """
+
+    boxes = detections["boxes"].numpy()
+    order = np.lexsort(
+        (boxes[:, 3], boxes[:, 2], boxes[:, 1], boxes[:, 0])
+        + (-detections["scores"].numpy(), detections["labels"].numpy())
+    )
+    order = torch.as_tensor(order)
+    return {k: v[order] for k, v in detections.items()}
+
+
+def check_parity(reference, candidate, atol=1e-4):
+    """Asserts two lists of detections agree on boxes, scores and labels"""
+
+    for ref, cand in zip(reference, candidate):
+        ref, cand = canonical_order(ref), canonical_order(cand)
+        assert ref["labels"].shape == cand["labels"].shape, (
+            f"detection count mismatch: {ref['labels'].shape[0]} vs "
+            f"{cand['labels'].shape[0]}"
+        )
+        assert torch.equal(ref["labels"], cand["labels"]), "labels differ"
+        assert torch.allclose(ref["scores"], cand["scores"], atol=atol), "scores differ"
+        assert torch.allclose(ref["boxes"], cand["boxes"], atol=atol), "boxes differ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--width", type=int, default=1216)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--logit-mean", type=float, default=-7.0)
+    parser.add_argument("--logit-std", type=float, default=1.5)
+    parser.add_argument("--nms-off", action="store_true")
+    parser.add_argument("--topk-candidates", type=int, default=1000)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    model = retinanet_resnet50_fpn(
+        pretrained=False,
+        pretrained_backbone=False,
+        nms_off=args.nms_off,
+        topk_candidates=None,
+    ).eval()
+
+    head_outputs, anchors, image_shapes, num_anchors_per_level = make_head_outputs(
+        model, args.height, args.width, args.logit_mean, args.logit_std
+    )
+
+    num_candidates = (
+        torch.sigmoid(head_outputs["cls_logits"]) > model.score_thresh
+    ).sum()
+    print(
+        f"image {args.height}x{args.width}: {anchors[0].shape[0]} anchors, "
+        f"{num_candidates.item()} (anchor, class) candidates above {model.score_thresh}"
+    )
+
+    reference, reference_ms = time_fn(
+        lambda: model.postprocess_detections_per_class(
+            head_outputs, anchors, image_shapes
+        ),
+        args.repeats,
+    )
+    vectorized, vectorized_ms = time_fn(
+        lambda: model.postprocess_detections(
+            head_outputs, anchors, image_shapes, num_anchors_per_level
+        ),
+        args.repeats,
+    )
+
+    model.topk_candidates = args.topk_candidates
+    capped, capped_ms = time_fn(
+        lambda: model.postprocess_detections(
+            head_outputs, anchors, image_shapes, num_anchors_per_level
+        ),
+        args.repeats,
+    )
+
+    check_parity(reference, vectorized)
+    print(f"parity OK: {reference[0]['labels'].shape[0]} detections match")
+    print(
+        f"topk_candidates={args.topk_candidates}: "
+        f"{capped[0]['labels'].shape[0]} detections"
+    )
+
+    for name, timings in [
+        ("per-class loop", reference_ms),
+        ("vectorized", vectorized_ms),
+        (f"topk {args.topk_candidates}", capped_ms),
+    ]:
+        print(
+            f"{name:>15}: median {np.median(timings):8.1f} ms   "
+            f"min {timings.min():8.1f} ms"
+        )
+    print(f"speedup: {np.median(reference_ms) / np.median(vectorized_ms):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares the latency and accuracy of the RetinaNet resolution presets (fast,
+balanced, full) on a small local image set.
+
+Every preset runs on the same images. Detections of the full preset above
+--gt-threshold act as pseudo ground truth, and each preset is scored against them
+with the mean over classes of the average precision at --iou, so the table
+reports how much accuracy each speedup costs relative to running at full size.
+
+Run from the root directory of the repo (defaults to the preset images):
+
+    python benchmarks/bench_presets.py
+    python benchmarks/bench_presets.py path/to/images/ --repeats 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import torch
+from torchvision import transforms
+from torchvision.ops import box_iou
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.app_utils import PRESET_IMAGES
+from src.model_utils import predict
+from src.pipeline_utils import iter_image_paths, decode_image
+from src.retinanet import RESOLUTION_PRESETS, retinanet_resnet50_fpn
+
+
+def average_precision(predictions, ground_truths, iou_thresh):
+    """
+    Computes the area under the interpolated precision/recall curve of one class.
+
+    Args:
+        predictions - list of (image_index, score, box) over all images
+        ground_truths - dict of image_index to an [N, 4] tensor of boxes
+        iou_thresh - minimum IoU for a prediction to match a ground truth box
+
+    Returns:
+        ap (float)
+    """
+
+    num_gt = sum(len(boxes) for boxes in ground_truths.values())
+    matched = {
+        i: torch.zeros(len(boxes), dtype=torch.bool)
+        for i, boxes in ground_truths.items()
+    }
+
+    true_positives = []
+    for image_index, _, box in sorted(predictions, key=lambda p: -p[1]):
+        gt_boxes = ground_truths.get(image_index)
+        is_match = False
+        if gt_boxes is not None and len(gt_boxes):
+            ious = box_iou(box[None], gt_boxes)[0]
+            ious[matched[image_index]] = -1
+            best_iou, best = ious.max(0)
+            if best_iou >= iou_thresh:
+                matched[image_index][best] = True
+                is_match = True
+        true_positives.append(is_match)
+
+    true_positives = np.array(true_positives, dtype=np.float64)
+    tp = np.cumsum(true_positives)
+    fp = np.cumsum(1 - true_positives)
+    recall = np.concatenate([[0], tp / num_gt, [1]])
+    precision = np.concatenate([[1], tp / np.maximum(tp + fp, 1e-9), [0]])
+
+    # make precision monotonically decreasing before integrating over recall
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    changes = np.where(recall[1:] != recall[:-1])[0]
+    return float(
+        np.sum((recall[changes + 1] - recall[changes]) * precision[changes + 1])
+    )
+
+
+def mean_average_precision(detections, ground_truths, iou_thresh):
+    """
+    Averages the per-class AP over every class present in the ground truth.
+
+    Args:
+        detections - list with one dict of boxes, scores, labels per image
+        ground_truths - list with one dict of boxes, labels per image
+
+    Returns:
+        map (float) - None when the ground truth holds no boxes
+    """
+
+    classes = sorted(
+        set(label for gt in ground_truths for label in gt["labels"].tolist())
+    )
+    if not classes:
+        return None
+
+    aps = []
+    for label in classes:
+        predictions = [
+            (i, float(score), box)
+            for i, det in enumerate(detections)
+            for box, score in zip(
+                det["boxes"][det["labels"] == label],
+                det["scores"][det["labels"] == label],
+            )
+        ]
+        gt_boxes = {
+            i: gt["boxes"][gt["labels"] == label] for i, gt in enumerate(ground_truths)
+        }
+        aps.append(average_precision(predictions, gt_boxes, iou_thresh))
+    return float(np.mean(aps))
+
+
+def run_preset(model, images, transform, repeats, detection_threshold):
+    """Returns per-image latencies in ms and the detections of the last repeat"""
+
+    # warm the anchor cache and allocator for this resolution
+    predict(model, images[0], transform, detection_threshold)
+
+    timings = []
+    for _ in range(repeats):
+        detections = []
+        for image in images:
+            start = time.perf_counter()
+            detections.append(predict(model, image, transform, detection_threshold))
+            timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings), detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "inputs", nargs="*", help="image files, directories or .txt file lists"
+    )
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument(
+        "--detection-threshold",
+        type=float,
+        default=0.05,
+        help="score above which detections are kept for scoring",
+    )
+    parser.add_argument(
+        "--gt-threshold",
+        type=float,
+        default=0.5,
+        help="score above which full preset detections count as ground truth",
+    )
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument(
+        "--random-weights",
+        action="store_true",
+        help="skip loading the COCO weights; latency is unaffected but mAP is meaningless",
+    )
+    parser.add_argument("--save", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    img_paths = list(iter_image_paths(args.inputs or list(PRESET_IMAGES.values())))
+    images = [decode_image(path) for path in img_paths]
+    transform = transforms.Compose([transforms.ToTensor()])
+
+    model = retinanet_resnet50_fpn(
+        pretrained=not args.random_weights, pretrained_backbone=False
+    ).eval()
+
+    results = {}
+    for preset in RESOLUTION_PRESETS:
+        timings, detections = run_preset(
+            model.with_resolution(preset),
+            images,
+            transform,
+            args.repeats,
+            args.detection_threshold,
+        )
+        results[preset] = {"timings": timings, "detections": detections}
+
+    ground_truths = [
+        {k: det[k][det["scores"] > args.gt_threshold] for k in ["boxes", "labels"]}
+        for det in results["full"]["detections"]
+    ]
+    num_gt = sum(len(gt["boxes"]) for gt in ground_truths)
+    print(
+        f"{len(images)} images, {num_gt} full preset detections above "
+        f"{args.gt_threshold} used as ground truth"
+    )
+
+    full_p50 = np.median(results["full"]["timings"])
+    summary = {}
+    print(f"{'preset':>10} {'min/max':>10} {'p50 ms':>9} {'speedup':>8} {'mAP':>7}")
+    for preset, result in results.items():
+        p50 = float(np.median(result["timings"]))
+        map_score = mean_average_precision(
+            result["detections"], ground_truths, args.iou
+        )
+        summary[preset] = {
+            "min_size": RESOLUTION_PRESETS[preset][0],
+            "max_size": RESOLUTION_PRESETS[preset][1],
+            "p50_ms": p50,
+            "mean_ms": float(np.mean(result["timings"])),
+            "speedup": float(full_p50 / p50),
+            "map": map_score,
+        }
+        map_text = "n/a" if map_score is None else f"{map_score:.3f}"
+        print(
+            f"{preset:>10} {'%d/%d' % RESOLUTION_PRESETS[preset]:>10} {p50:9.1f} "
+            f"{full_p50 / p50:7.2f}x {map_text:>7}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"wrote {args.save}")
+
+
+if __name__ == "__main__":
+    main()
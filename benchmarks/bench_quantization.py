@@ -0,0 +1,165 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares the float RetinaNet against its int8 statically quantized copy, see
+src/quantization_utils.py, on the preset images (or the given images).
+
+The quantized model is calibrated on the images of --calibration. Detections of
+the float model above --gt-threshold act as pseudo ground truth, and the
+quantized model is scored against them with the mAP of bench_presets.py, so the
+table reports latency, serialized model size and how well the two agree.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_quantization.py --calibration path/to/images/ --preset fast
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_presets import mean_average_precision
+from src.app_utils import PRESET_IMAGES
+from src.model_registry import get_model
+from src.model_utils import threshold_outputs
+from src.retinanet import RESOLUTION_PRESETS
+from src.quantization_utils import quantize_retinanet, model_size_bytes
+from src.pipeline_utils import iter_image_paths, decode_image
+
+
+def run_model(model, images, repeats, detection_threshold):
+    """Returns per-image latencies in ms and the detections of the last repeat"""
+
+    model(images[:1])
+
+    timings = []
+    for _ in range(repeats):
+        detections = []
+        for image in images:
+            start = time.perf_counter()
+            outputs = model([image])[0]
+            timings.append((time.perf_counter() - start) * 1000)
+            detections.append(threshold_outputs(outputs, detection_threshold))
+    return np.array(timings), detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "inputs", nargs="*", help="image files, directories or .txt file lists"
+    )
+    parser.add_argument(
+        "--calibration",
+        nargs="+",
+        default=None,
+        help="calibration images or directories, defaults to the evaluated images",
+    )
+    parser.add_argument("--preset", choices=list(RESOLUTION_PRESETS), default="full")
+    parser.add_argument("--engine", default="fbgemm", choices=["fbgemm", "qnnpack"])
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--detection-threshold", type=float, default=0.05)
+    parser.add_argument(
+        "--gt-threshold",
+        type=float,
+        default=0.5,
+        help="score above which float detections count as ground truth",
+    )
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    img_paths = list(iter_image_paths(args.inputs or list(PRESET_IMAGES.values())))
+    images = [decode_image(path) for path in img_paths]
+    calibration_images = images
+    if args.calibration:
+        calibration_images = [
+            decode_image(path) for path in iter_image_paths(args.calibration)
+        ]
+
+    model = get_model(preset=args.preset)
+    start = time.perf_counter()
+    quantized = quantize_retinanet(model, calibration_images, engine=args.engine)
+    quantize_seconds = time.perf_counter() - start
+
+    results = {}
+    for name, variant in [("float", model), ("int8", quantized)]:
+        timings, detections = run_model(
+            variant, images, args.repeats, args.detection_threshold
+        )
+        results[name] = {
+            "timings": timings,
+            "detections": detections,
+            "size": model_size_bytes(variant),
+        }
+
+    ground_truths = [
+        {k: det[k][det["scores"] > args.gt_threshold] for k in ["boxes", "labels"]}
+        for det in results["float"]["detections"]
+    ]
+    num_gt = sum(len(gt["boxes"]) for gt in ground_truths)
+    print(
+        f"preset {args.preset}, {len(images)} images, calibrated on "
+        f"{len(calibration_images)} in {quantize_seconds:.1f}s, {num_gt} float "
+        f"detections above {args.gt_threshold} used as ground truth"
+    )
+
+    float_p50 = np.median(results["float"]["timings"])
+    print(f"{'model':>6} {'p50 ms':>9} {'speedup':>8} {'size MB':>8} {'mAP':>7}")
+    for name, result in results.items():
+        p50 = np.median(result["timings"])
+        map_score = mean_average_precision(
+            result["detections"], ground_truths, args.iou
+        )
+        map_text = "n/a" if map_score is None else f"{map_score:.3f}"
+        print(
+            f"{name:>6} {p50:9.1f} {float_p50 / p50:7.2f}x "
+            f"{result['size'] / 2**20:8.1f} {map_text:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Compares eager RetinaNet against its exported TorchScript modules for a resolution
+preset, exporting one module per distinct padded input size among the images.
+
+It checks that eager and scripted detections match on every image and reports
+the export time of each module and the per-image latency of both paths.
+
+Run from the root directory of the repo (defaults to the preset images):
+
+    python benchmarks/bench_torchscript.py path/to/images/ --preset fast --repeats 5
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_postprocess import check_parity
+from src.app_utils import PRESET_IMAGES
+from src.model_registry import get_model
+from src.retinanet import RESOLUTION_PRESETS
+from src.export_utils import export_torchscript, padded_input_size
+from src.pipeline_utils import iter_image_paths, decode_image
+
+
+def time_model(model, images, repeats):
+    timings = []
+    for _ in range(repeats):
+        for image in images:
+            start = time.perf_counter()
+            model([image])
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("inputs", nargs="*", help="image files or directories")
+    parser.add_argument("--preset", choices=list(RESOLUTION_PRESETS), default="full")
+    parser.add_argument("--fuse-head", action="store_true")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-2)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    model = get_model(preset=args.preset)
+    if args.fuse_head:
+        model.fuse_head()
+
+    img_paths = list(iter_image_paths(args.inputs or list(PRESET_IMAGES.values())))
+    images_by_size = {}
+    for path in img_paths:
+        image = decode_image(path)
+        input_size = padded_input_size(model, image.shape[-2:])
+        images_by_size.setdefault(input_size, []).append(image)
+
+    eager_timings, scripted_timings = [], []
+    for input_size, images in images_by_size.items():
+        start = time.perf_counter()
+        scripted = export_torchscript(model, input_size)
+        export_seconds = time.perf_counter() - start
+
+        # the first calls of a scripted module run the profiling executor
+        for _ in range(2):
+            scripted(images[:1])
+
+        check_parity(
+            [model([image])[0] for image in images],
+            [scripted([image])[0] for image in images],
+            atol=args.atol,
+        )
+        print(
+            f"input {input_size[0]}x{input_size[1]}: {len(images)} images, "
+            f"export {export_seconds:.1f}s, parity ok"
+        )
+
+        eager_timings += time_model(model, images, args.repeats)
+        scripted_timings += time_model(scripted, images, args.repeats)
+
+    print(f"preset {args.preset}, {len(img_paths)} images")
+    print(f"{'module':>12} {'median ms':>10} {'min ms':>9}")
+    for name, timings in [("eager", eager_timings), ("torchscript", scripted_timings)]:
+        print(f"{name:>12} {np.median(timings):10.1f} {np.min(timings):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Measures how much memory RetinaNet keeps pinned in viz_artifacts between forward
+passes, for the default production path and for each capture() setting, and
+asserts that the default path keeps nothing.
+
+Run from the root directory of the repo:
+
+    python benchmarks/bench_viz_artifacts.py --height 800 --width 1333
+"""
+
+import os
+import gc
+import sys
+import argparse
+
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_registry import resident_memory_bytes
+from src.retinanet import retinanet_resnet50_fpn, VIZ_ARTIFACT_KINDS
+
+
+def retained_bytes(obj, seen=None):
+    """
+    Sums the storage held by every tensor reachable from obj, counting shared
+    storages once
+    """
+
+    if seen is None:
+        seen = set()
+
+    if isinstance(obj, torch.Tensor):
+        storage = obj.storage()
+        if storage.data_ptr() in seen:
+            return 0
+        seen.add(storage.data_ptr())
+        return storage.size() * storage.element_size()
+    if isinstance(obj, dict):
+        return sum(retained_bytes(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(retained_bytes(v, seen) for v in obj)
+    if hasattr(obj, "tensors"):
+        # torchvision ImageList
+        return retained_bytes(obj.tensors, seen)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--width", type=int, default=1333)
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+
+    model = retinanet_resnet50_fpn(pretrained=False, pretrained_backbone=False).eval()
+    image = torch.rand(3, args.height, args.width)
+
+    settings = [("default", None)] + [(kind, (kind,)) for kind in VIZ_ARTIFACT_KINDS]
+    settings.append(("all", VIZ_ARTIFACT_KINDS))
+
+    results = {}
+    for name, kinds in settings:
+        if kinds is None:
+            model([image])
+        else:
+            with model.capture(kinds):
+                model([image])
+        gc.collect()
+
+        results[name] = retained_bytes(model.viz_artifacts)
+        print(
+            f"{name:>14}: {results[name] / 2 ** 20:8.1f} MB retained   "
+            f"(process RSS {resident_memory_bytes() / 2 ** 20:8.1f} MB)"
+        )
+
+    assert (
+        results["default"] == 0
+    ), "default inference should not keep any tensors in viz_artifacts"
+    print(f"default path saves {results['all'] / 2 ** 20:.1f} MB per model")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Rebuilds the precomputed app assets (figures, stats and arrays) of every preset
+image, or of the images listed in a JSON manifest of {name: image_path}.
+
+The model is loaded once in this process and shared with forked worker processes,
+each of which runs gather_data_artifacts() for one image and saves the result as
+an ArtifactStore in <data-dir>/<name>. Each store records a build stamp of the
+image hash, the weights and a hash of the src/ code, and images whose stamp is
+unchanged are skipped unless --force is given.
+
+Run from the root directory of the repo:
+
+    python scripts/build_presets.py --workers 3
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+
+import torch
+import matplotlib.pyplot as plt
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from src.app_utils import PRESET_IMAGES
+from src.artifact_cache import ARTIFACT_VERSION
+from src.artifact_store import ArtifactStore, write_data_artifacts
+from src.data_utils import gather_data_artifacts
+from src.model_registry import get_model
+from src.retinanet import model_urls
+from src.weight_store import file_sha256
+
+
+def code_version():
+    """Hashes the source of every module under src/ together with ARTIFACT_VERSION"""
+
+    sha256 = hashlib.sha256(str(ARTIFACT_VERSION).encode())
+    for path in sorted(glob.glob(os.path.join(ROOT_DIR, "src", "*.py"))):
+        with open(path, "rb") as f:
+            sha256.update(os.path.basename(path).encode())
+            sha256.update(f.read())
+    return sha256.hexdigest()
+
+
+def build_stamp(img_path, code_hash):
+    return {
+        "image_sha256": file_sha256(img_path),
+        "weights": os.path.basename(model_urls["retinanet_resnet50_fpn_coco"]),
+        "code_version": code_hash,
+    }
+
+
+def is_up_to_date(output_dir, stamp):
+    store = ArtifactStore(output_dir)
+    return store.exists() and "build" in store and store.load("build") == stamp
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+    plt.switch_backend("Agg")
+
+
+def build_one(job):
+    """Gathers and saves the artifacts of one image, runs in a worker process"""
+
+    name, img_path, output_dir, stamp = job
+    start = time.perf_counter()
+    try:
+        for subdir in ["fpn", "rpn", "nms"]:
+            os.makedirs(os.path.join(output_dir, subdir), exist_ok=True)
+
+        # figures are rendered serially here, the images are already spread
+        # over worker processes
+        data_artifacts = gather_data_artifacts(img_path, output_dir, num_workers=0)
+        store = write_data_artifacts(data_artifacts, output_dir)
+        store.save_json("build", stamp)
+        store.write_manifest()
+    except Exception as e:
+        return name, f"failed: {e!r}", time.perf_counter() - start
+    return name, "built", time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--manifest", help="JSON file of {name: image_path}, defaults to the presets"
+    )
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="defaults to one per image"
+    )
+    parser.add_argument("--force", action="store_true", help="rebuild every image")
+    args = parser.parse_args()
+
+    if args.manifest:
+        with open(args.manifest) as f:
+            images = json.load(f)
+    else:
+        images = PRESET_IMAGES
+
+    code_hash = code_version()
+    jobs = []
+    for name, img_path in images.items():
+        output_dir = os.path.join(args.data_dir, name)
+        stamp = build_stamp(img_path, code_hash)
+        if not args.force and is_up_to_date(output_dir, stamp):
+            print(f"{name:>12}: up to date")
+            continue
+        jobs.append((name, img_path, output_dir, stamp))
+
+    if not jobs:
+        return
+
+    num_workers = min(args.workers or len(jobs), len(jobs))
+    num_threads = max(1, torch.get_num_threads() // num_workers)
+
+    # load the weights before forking so every worker shares them copy-on-write
+    get_model()
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(
+        num_workers, initializer=_init_worker, initargs=(num_threads,)
+    ) as pool:
+        results = list(pool.imap_unordered(build_one, jobs))
+    total_s = time.perf_counter() - start
+
+    for name, status, seconds in sorted(results):
+        print(f"{name:>12}: {status} in {seconds:.1f}s")
+    print(f"built {len(jobs)} images with {num_workers} workers in {total_s:.1f}s")
+
+    if any(status != "built" for _, status, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Runs RetinaNet detection over directories or lists of images and writes one record
+per image to JSONL (or Parquet when the output path ends in .parquet).
+
+Images are decoded ahead of the model on a pool of worker threads and sent
+through predict_batch() in batches. An images/second summary is printed at the end.
+
+Run from the root directory of the repo:
+
+    python scripts/detect_images.py data/*/*.jpg --output detections.jsonl --batch-size 4
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+from torchvision import transforms
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_registry import get_model
+from src.retinanet import RESOLUTION_PRESETS
+from src.model_utils import predict_batch
+from src.export_utils import OnnxRuntimeBackend
+from src.quantization_utils import quantize_retinanet
+from src.pipeline_utils import (
+    iter_image_paths,
+    decode_image,
+    prefetch,
+    detections_to_record,
+    DetectionWriter,
+)
+
+
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "inputs", nargs="+", help="image files, directories or .txt file lists"
+    )
+    parser.add_argument("--output", default="detections.jsonl")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument(
+        "--workers", type=int, default=4, help="number of image decode threads"
+    )
+    parser.add_argument(
+        "--torch-threads", type=int, default=None, help="intra-op threads for torch"
+    )
+    parser.add_argument("--detection-threshold", type=float, default=0.7)
+    parser.add_argument(
+        "--preset",
+        choices=list(RESOLUTION_PRESETS),
+        default="full",
+        help="input resolution, trading accuracy for speed",
+    )
+    parser.add_argument(
+        "--onnx",
+        default=None,
+        help="run the backbone and head on ONNX Runtime from a graph written by "
+        "scripts/export_onnx.py",
+    )
+    parser.add_argument(
+        "--int8-calibration",
+        nargs="+",
+        default=None,
+        help="run an int8 quantized model, calibrated on these images or directories",
+    )
+    parser.add_argument(
+        "--channels-last",
+        action="store_true",
+        help="run the backbone and head in the NHWC memory format",
+    )
+    parser.add_argument(
+        "--bf16",
+        action="store_true",
+        help="run the backbone and head under bfloat16 CPU autocast (torch >= 1.10)",
+    )
+    args = parser.parse_args()
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+
+    model = get_model(
+        preset=args.preset,
+        channels_last=args.channels_last,
+        autocast_dtype=torch.bfloat16 if args.bf16 else None,
+    )
+    if args.int8_calibration:
+        calibration_images = [
+            decode_image(path) for path in iter_image_paths(args.int8_calibration)
+        ]
+        model = quantize_retinanet(model, calibration_images)
+    backend = None
+    if args.onnx:
+        backend = OnnxRuntimeBackend(args.onnx, num_threads=args.torch_threads)
+    transform = transforms.Compose([transforms.ToTensor()])
+
+    num_images = 0
+    num_failed = 0
+    start = time.perf_counter()
+
+    decoded = prefetch(
+        decode_image,
+        iter_image_paths(args.inputs),
+        num_workers=args.workers,
+        max_prefetch=args.batch_size * 4,
+    )
+
+    with DetectionWriter(args.output) as writer:
+        for batch in batched(decoded, args.batch_size):
+            failed = [(path, img) for path, img in batch if isinstance(img, Exception)]
+            batch = [
+                (path, img) for path, img in batch if not isinstance(img, Exception)
+            ]
+
+            for path, error in failed:
+                print(f"skipping {path}: {error}", file=sys.stderr)
+            num_failed += len(failed)
+
+            if not batch:
+                continue
+
+            outputs = predict_batch(
+                model,
+                [img for _, img in batch],
+                transform,
+                args.detection_threshold,
+                batch_size=args.batch_size,
+                backend=backend,
+            )
+            for (path, img), image_outputs in zip(batch, outputs):
+                writer.write(
+                    detections_to_record(
+                        image_outputs,
+                        path=path,
+                        height=img.shape[-2],
+                        width=img.shape[-1],
+                    )
+                )
+            num_images += len(batch)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"processed {num_images} images ({num_failed} failed) in {elapsed:.1f}s: "
+        f"{num_images / elapsed:.2f} images/s -> {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
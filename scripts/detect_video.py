@@ -0,0 +1,136 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Runs RetinaNet detection over a video file or an image sequence and writes one
+record per frame, with its index and timestamp, to JSONL (or Parquet when the
+output path ends in .parquet).
+
+Frames are decoded on a background thread while earlier frames are in the model.
+Videos need opencv-python or av. Pass --static-camera for fixed-size footage to
+reuse one input buffer and the cached anchors across frames.
+
+Run from the root directory of the repo:
+
+    python scripts/detect_video.py clip.mp4 --output clip.jsonl --static-camera
+    python scripts/detect_video.py frames/ --fps 10 --output frames.jsonl
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_registry import get_model
+from src.retinanet import RESOLUTION_PRESETS
+from src.pipeline_utils import detections_to_record, DetectionWriter
+from src.stream_utils import stream_detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "source",
+        nargs="+",
+        help="video file, or image files / directories / .txt lists",
+    )
+    parser.add_argument("--output", default="detections.jsonl")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=16,
+        help="decoded frames held ahead of the model",
+    )
+    parser.add_argument(
+        "--fps", type=float, default=None, help="frame rate of image sequences"
+    )
+    parser.add_argument("--static-camera", action="store_true")
+    parser.add_argument(
+        "--torch-threads", type=int, default=None, help="intra-op threads for torch"
+    )
+    parser.add_argument("--detection-threshold", type=float, default=0.7)
+    parser.add_argument(
+        "--preset",
+        choices=list(RESOLUTION_PRESETS),
+        default="full",
+        help="input resolution, trading accuracy for speed",
+    )
+    args = parser.parse_args()
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+
+    source = args.source[0] if len(args.source) == 1 else args.source
+    results = stream_detections(
+        get_model(preset=args.preset),
+        source,
+        batch_size=args.batch_size,
+        detection_threshold=args.detection_threshold,
+        max_queue=args.max_queue,
+        static_camera=args.static_camera,
+        fps=args.fps,
+    )
+
+    num_frames = 0
+    start = time.perf_counter()
+    with DetectionWriter(args.output) as writer:
+        for result in results:
+            writer.write(
+                detections_to_record(
+                    result["outputs"],
+                    frame_index=result["frame_index"],
+                    timestamp_s=round(result["timestamp_s"], 3),
+                )
+            )
+            num_frames += 1
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{num_frames} frames in {elapsed:.1f}s "
+        f"({num_frames / max(elapsed, 1e-9):.2f} frames/s), wrote {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Exports the RetinaNet inference path as a frozen TorchScript module for one
+resolution preset and one padded input size.
+
+The input size is either given directly with --size or derived from a reference
+image with --image, in which case every image of the same aspect ratio fits it.
+The exported file carries its preset, input size, thresholds and the COCO label
+names, and can be run without the src package by scripts/run_torchscript.py.
+
+Run from the root directory of the repo:
+
+    python scripts/export_torchscript.py --preset fast --image data/giraffe/giraffe.jpg
+"""
+
+import os
+import sys
+import argparse
+
+import torch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model_registry import get_model
+from src.retinanet import RESOLUTION_PRESETS
+from src.export_utils import export_torchscript, padded_input_size, save_exported
+
+
+def parse_size(value):
+    height, width = value.lower().split("x")
+    return int(height), int(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--preset", choices=list(RESOLUTION_PRESETS), default="full")
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--image", help="reference image giving the padded input size")
+    size.add_argument("--size", type=parse_size, help="padded input size as HxW")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--fuse-head", action="store_true")
+    parser.add_argument(
+        "--no-freeze", action="store_true", help="keep the weights as attributes"
+    )
+    args = parser.parse_args()
+
+    model = get_model(preset=args.preset)
+    if args.fuse_head:
+        model.fuse_head()
+
+    if args.image:
+        width, height = Image.open(args.image).size
+        input_size = padded_input_size(model, (height, width))
+    else:
+        input_size = args.size
+
+    output = (
+        args.output or f"retinanet_{args.preset}_{input_size[0]}x{input_size[1]}.pt"
+    )
+
+    with torch.no_grad():
+        module = export_torchscript(model, input_size, freeze=not args.no_freeze)
+    save_exported(
+        module,
+        output,
+        preset=args.preset,
+        input_size=list(input_size),
+        score_thresh=model.score_thresh,
+        nms_thresh=model.nms_thresh,
+        detections_per_img=model.detections_per_img,
+    )
+    print(
+        f"exported {args.preset} preset at {input_size[0]}x{input_size[1]} -> {output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Populates a local weight store for retinanet_resnet50_fpn so that inference hosts
+without outbound network can start from disk.
+
+The COCO checkpoint is downloaded (or taken from --source), checked against the
+sha256 prefix in its torchvision filename, copied into the output directory and
+converted to a memory-mappable .safetensors file with a .sha256 sidecar. Startup
+time for each format is reported at the end.
+
+Run from the root directory of the repo:
+
+    python scripts/prepare_weights.py --output-dir models
+    RETINANET_WEIGHTS_DIR=models RETINANET_OFFLINE=1 streamlit run app/app.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+
+import torch
+from torch.hub import download_url_to_file
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retinanet import model_urls, retinanet_resnet50_fpn
+from src.weight_store import save_safetensors, verify_checksum
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output-dir", default="models")
+    parser.add_argument(
+        "--source", help="existing .pth checkpoint to use instead of downloading"
+    )
+    args = parser.parse_args()
+
+    url = model_urls["retinanet_resnet50_fpn_coco"]
+    filename = os.path.basename(url)
+    stem = os.path.splitext(filename)[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    pth_path = os.path.join(args.output_dir, filename)
+    if args.source:
+        shutil.copyfile(args.source, pth_path)
+    elif not os.path.exists(pth_path):
+        download_url_to_file(url, pth_path, progress=True)
+    verify_checksum(pth_path)
+    print(f"verified {pth_path}")
+
+    state_dict = torch.load(pth_path, map_location="cpu")
+    safetensors_path = os.path.join(args.output_dir, f"{stem}.safetensors")
+    save_safetensors(state_dict, safetensors_path, metadata={"source": filename})
+    print(f"wrote {safetensors_path}")
+
+    # time a cold model build from each format
+    for path in [pth_path, safetensors_path]:
+        tmp_dir = os.path.join(args.output_dir, ".startup_check")
+        os.makedirs(tmp_dir, exist_ok=True)
+        for suffix in ["", ".sha256"]:
+            if os.path.exists(path + suffix):
+                shutil.copyfile(
+                    path + suffix,
+                    os.path.join(tmp_dir, os.path.basename(path) + suffix),
+                )
+
+        start = time.perf_counter()
+        model = retinanet_resnet50_fpn(pretrained=True, weights_dir=tmp_dir)
+        total_s = time.perf_counter() - start
+        shutil.rmtree(tmp_dir)
+
+        info = model.load_info
+        print(
+            f"{info['format']:>12}: model ready in {total_s:.2f}s "
+            f"(weights {info['load_s']:.2f}s, of which checksum {info['verify_s']:.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Runs a module written by scripts/export_torchscript.py on a list of images and
+prints (or writes as JSONL) the detections above a threshold.
+
+Only torch, torchvision and PIL are needed: the src package is not imported, so
+this file can be copied next to the exported module and run on its own.
+
+    python scripts/run_torchscript.py retinanet_fast_512x768.pt data/giraffe/giraffe.jpg
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import torch
+import torchvision  # noqa: F401, registers the torchvision ops used by the module
+from PIL import Image
+from torchvision.transforms.functional import to_tensor
+
+METADATA_FILENAME = "metadata.json"
+
+
+def load_module(path, map_location="cpu"):
+    """Returns the scripted module and its metadata"""
+
+    extra_files = {METADATA_FILENAME: ""}
+    module = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    return module, json.loads(extra_files[METADATA_FILENAME])
+
+
+def to_record(path, detections, labels, threshold):
+    keep = detections["scores"] > threshold
+    return {
+        "path": path,
+        "boxes": detections["boxes"][keep].tolist(),
+        "scores": detections["scores"][keep].tolist(),
+        "labels": [labels[i] for i in detections["labels"][keep].tolist()],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("module")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--detection-threshold", type=float, default=0.7)
+    parser.add_argument("--output", default=None, help="JSONL file, stdout if unset")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    module, metadata = load_module(args.module)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for path in args.images:
+            image = to_tensor(Image.open(path).convert("RGB"))
+            start = time.perf_counter()
+            detections = module([image])[0]
+            elapsed = (time.perf_counter() - start) * 1000
+
+            record = to_record(
+                path, detections, metadata["labels"], args.detection_threshold
+            )
+            output.write(json.dumps(record) + "\n")
+            print(
+                f"{path}: {len(record['labels'])} detections in {elapsed:.0f} ms",
+                file=sys.stderr,
+            )
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
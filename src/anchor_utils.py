@@ -42,10 +42,13 @@
 # found at https://github.com/pytorch/vision/blob/master/torchvision/models/detection/anchor_utils.py
 
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
+import threading
+
 import torch
 from torch import nn, Tensor
+from collections import OrderedDict
 
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from torchvision.models.detection.image_list import ImageList
 
 
@@ -65,20 +68,24 @@ class AnchorGenerator(nn.Module):
     and AnchorGenerator will output a set of sizes[i] * aspect_ratios[i] anchors
     per spatial location for feature map i.
 
+    Generated anchors are kept in a bounded LRU cache keyed by
+    (grid sizes, strides, dtype, device), so repeated input shapes reuse them.
+
     Args:
         sizes (Tuple[Tuple[int]]):
         aspect_ratios (Tuple[Tuple[float]]):
+        cache_size (int): maximum number of input shapes to keep anchors for
     """
 
     __annotations__ = {
         "cell_anchors": Optional[List[torch.Tensor]],
-        "_cache": Dict[str, List[torch.Tensor]],
     }
 
     def __init__(
         self,
         sizes=((128, 256, 512),),
         aspect_ratios=((0.5, 1.0, 2.0),),
+        cache_size=16,
     ):
         super(AnchorGenerator, self).__init__()
 
@@ -93,7 +100,12 @@ class AnchorGenerator(nn.Module):
         self.sizes = sizes
         self.aspect_ratios = aspect_ratios
         self.cell_anchors = None
-        self._cache = {}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # the generator is shared by every thread serving the model
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.anchor_artifacts = {}
 
     # TODO: https://github.com/pytorch/pytorch/issues/26792
@@ -122,9 +134,9 @@ class AnchorGenerator(nn.Module):
         if self.cell_anchors is not None:
             cell_anchors = self.cell_anchors
             assert cell_anchors is not None
-            # suppose that all anchors have the same device
+            # suppose that all anchors have the same device and dtype
             # which is a valid assumption in the current state of the codebase
-            if cell_anchors[0].device == device:
+            if cell_anchors[0].device == device and cell_anchors[0].dtype == dtype:
                 return
 
         cell_anchors = [
@@ -182,21 +194,70 @@ class AnchorGenerator(nn.Module):
 
     def cached_grid_anchors(
         self, grid_sizes: List[List[int]], strides: List[List[Tensor]]
-    ) -> List[Tensor]:
-        key = str(grid_sizes) + str(strides)
-        if key in self._cache:
-            return self._cache[key]
-        anchors = self.grid_anchors(grid_sizes, strides)
-        self._cache[key] = anchors
+    ) -> Tensor:
+        """
+        Returns the anchors of every feature map concatenated into a single
+        (num_anchors, 4) tensor. The tensor is shared by every caller hitting the
+        same cache entry and must not be modified in place.
+        """
+        cell_anchors = self.cell_anchors
+        assert cell_anchors is not None
+
+        key = (
+            tuple(tuple(int(g) for g in size) for size in grid_sizes),
+            tuple(tuple(int(s) for s in stride) for stride in strides),
+            cell_anchors[0].dtype,
+            str(cell_anchors[0].device),
+        )
+        with self._cache_lock:
+            anchors = self._cache.get(key)
+            if anchors is not None:
+                self.cache_hits += 1
+                self._cache.move_to_end(key)
+                return anchors
+            self.cache_misses += 1
+
+        anchors = torch.cat(self.grid_anchors(grid_sizes, strides))
+        with self._cache_lock:
+            # another thread may have filled the entry in the meantime
+            anchors = self._cache.setdefault(key, anchors)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
         return anchors
 
-    def forward(
-        self, image_list: ImageList, feature_maps: List[Tensor]
-    ) -> List[Tensor]:
-        grid_sizes = list([feature_map.shape[-2:] for feature_map in feature_maps])
-        image_size = image_list.tensors.shape[-2:]
-        dtype, device = feature_maps[0].dtype, feature_maps[0].device
-        strides = [
+    def cache_info(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "size": len(self._cache),
+                "maxsize": self.cache_size,
+            }
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+
+    def __getstate__(self):
+        # locks cannot be pickled, e.g. by copy.deepcopy(model)
+        state = self.__dict__.copy()
+        del state["_cache_lock"]
+        return state
+
+    def __setstate__(self, state):
+        super(AnchorGenerator, self).__setstate__(state)
+        self._cache_lock = threading.Lock()
+
+    def compute_strides(
+        self,
+        image_size: Tuple[int, int],
+        grid_sizes: List[List[int]],
+        device: torch.device = torch.device("cpu"),
+    ) -> List[List[Tensor]]:
+        return [
             [
                 torch.tensor(image_size[0] // g[0], dtype=torch.int64, device=device),
                 torch.tensor(image_size[1] // g[1], dtype=torch.int64, device=device),
@@ -204,21 +265,52 @@ class AnchorGenerator(nn.Module):
             for g in grid_sizes
         ]
 
-        # ARR Addition
+    def record_artifacts(
+        self,
+        image_size: Tuple[int, int],
+        grid_sizes: List[List[int]],
+        strides: List[List[Tensor]],
+    ):
+        """
+        Keeps the image size, grid sizes and strides of the latest anchors in
+        anchor_artifacts, for the visualizations and postprocess_artifacts()
+        """
         self.anchor_artifacts["grid_sizes"] = grid_sizes
         self.anchor_artifacts["image_size"] = image_size
         self.anchor_artifacts["strides"] = strides
 
+    def precompute(
+        self,
+        image_size: Tuple[int, int],
+        grid_sizes: List[List[int]],
+        dtype: torch.dtype = torch.float32,
+        device: torch.device = torch.device("cpu"),
+    ) -> Tensor:
+        """
+        Fills the cache with the anchors of a padded image size and its feature map
+        grid sizes, so the first forward pass on that shape is a cache hit.
+        """
+        strides = self.compute_strides(image_size, grid_sizes, device)
+        self.set_cell_anchors(dtype, device)
+        return self.cached_grid_anchors(grid_sizes, strides)
+
+    def forward(
+        self, image_list: ImageList, feature_maps: List[Tensor]
+    ) -> List[Tensor]:
+        grid_sizes = list([feature_map.shape[-2:] for feature_map in feature_maps])
+        image_size = image_list.tensors.shape[-2:]
+        dtype, device = feature_maps[0].dtype, feature_maps[0].device
+        strides = self.compute_strides(image_size, grid_sizes, device)
+
+        # ARR Addition
+        self.record_artifacts(image_size, grid_sizes, strides)
+
         self.set_cell_anchors(dtype, device)
         anchors_over_all_feature_maps = self.cached_grid_anchors(grid_sizes, strides)
-        anchors: List[List[torch.Tensor]] = []
-        for i in range(len(image_list.image_sizes)):
-            anchors_in_image = [
-                anchors_per_feature_map
-                for anchors_per_feature_map in anchors_over_all_feature_maps
-            ]
-            anchors.append(anchors_in_image)
-        anchors = [torch.cat(anchors_per_image) for anchors_per_image in anchors]
-        # Clear the cache in case that memory leaks.
-        self._cache.clear()
+
+        # every image in the batch is padded to the same size and therefore has
+        # the same anchors, so they all share one read-only tensor
+        anchors: List[Tensor] = [
+            anchors_over_all_feature_maps for _ in range(len(image_list.image_sizes))
+        ]
         return anchors
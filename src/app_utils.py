@@ -39,13 +39,17 @@
 # ###########################################################################
 
 import os
-import torch
+import atexit
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from PIL import Image
 
-
 PRESET_IMAGES = {
     "giraffe": "data/giraffe/giraffe.jpg",
     "snowboard": "data/snowboard/snowboard.jpg",
@@ -61,6 +65,14 @@ APP_PAGES = [
 ]
 
 
+def to_numpy(x):
+    """Converts a tensor (or anything array-like) to a NumPy array"""
+
+    if hasattr(x, "detach"):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
 def convert_bb_spec(xmin, ymin, xmax, ymax):
     """
     Convert a bounding box representation
@@ -79,11 +91,12 @@ def plot_predictions(image, outputs, label_map, nms_off=False):
     """
     Overlay bounding box predictions on an image
 
-    If nms_off is True, jitter a series of bounding boxes to imitate non-nms behavior
+    If nms_off is True, the outputs are expected to be pre-NMS detections and only
+    the boxes are drawn, since labels and scores of overlapping boxes are unreadable
 
     Args:
-        image - PIL image as RGB format
-        outputs - boxes, scores, labels output from predict()
+        image - PIL image or NumPy array as RGB format
+        outputs - boxes, scores, labels output from predict(), as tensors or arrays
         label_map - list mapping of idx to label name
         nms_off - indicates if visualization is with or without NMS
 
@@ -98,20 +111,8 @@ def plot_predictions(image, outputs, label_map, nms_off=False):
     np.random.seed(24)
     colors = np.random.uniform(size=(len(label_map), 3))
 
-    outputs = {k: v.detach().numpy() for k, v in outputs.items()}
-    boxes, scores, labels = outputs.values()
-
-    if nms_off:
-        # append N new jittered boxes to simulate NMS, same for labels
-        N = 5
-        boxes = [[np.random.randn(4) * 5 + box for i in range(N)] for box in boxes]
-        boxes = np.array([x for l in boxes for x in l])
-
-        new_labels = []
-        for label in labels:
-            new_labels += N * [label]
-
-        labels = np.array(new_labels)
+    outputs = {k: to_numpy(v) for k, v in outputs.items()}
+    boxes, scores, labels = outputs["boxes"], outputs["scores"], outputs["labels"]
 
     for i, box in enumerate(boxes):
 
@@ -174,7 +175,7 @@ def sample_feature_maps(features, n):
     samples = {}
     for i, plevel in enumerate(features):
 
-        maps = plevel.squeeze(0).detach().numpy()
+        maps = to_numpy(plevel).squeeze(0)
         channel_idx = np.random.choice(range(maps.shape[0]), n)
         samples[i] = maps[channel_idx, :, :]
 
@@ -208,44 +209,43 @@ def plot_feature_samples(samples):
     return fig
 
 
-def get_feature_map_plot(model):
-    """
-    Uses the computed features saved in retinanet.model to plot samples
-    of the feature map.
-
-    Note - must pass the output of this function to st.pyplot() to render in streamlit
-
+def get_anchor_plot_inputs(
+    image, anchor_generator, pred_boxes, features, anchor_artifacts=None
+):
     """
+    Collects the inputs of plot_pyramid_level_anchors for each pyramid level as
+    plain Python and NumPy objects, so that they can be sent to worker processes
 
-    samples = sample_feature_maps(model.viz_artifacts["features"], 7)
-    fig = plot_feature_samples(samples)
-
-    return fig
-
-
-def get_anchor_plots(image, anchor_generator, pred_boxes, features):
-    """
-    Uses the model inference outputs to overlay anchor boxes on detected objects at
-    varying feature pyramid levels
+    anchor_artifacts holds the grid sizes, image size and strides of the forward
+    pass, as returned by get_inference_artifacts. It defaults to the ones the
+    anchor generator kept from its last call.
 
     """
 
-    anchor_plots = {}
-    for i in range(5):
-        fig, fig_stats = plot_pyramid_level_anchors(
-            i,
-            img=image,
-            image_size=anchor_generator.anchor_artifacts["image_size"],
-            strides=anchor_generator.anchor_artifacts["strides"],
-            grid_sizes=anchor_generator.anchor_artifacts["grid_sizes"],
-            cell_anchors=anchor_generator.cell_anchors.copy(),
+    artifacts = anchor_artifacts
+    if artifacts is None:
+        artifacts = anchor_generator.anchor_artifacts
+    image_size = tuple(int(i) for i in artifacts["image_size"])
+    strides = [[int(s) for s in stride] for stride in artifacts["strides"]]
+    grid_sizes = [[int(g) for g in grid_size] for grid_size in artifacts["grid_sizes"]]
+    cell_anchors = [to_numpy(a) for a in anchor_generator.cell_anchors]
+    pred_boxes = to_numpy(pred_boxes)
+    img = np.asarray(image)
+
+    return [
+        dict(
+            pyramid_level_idx=i,
+            img=img,
+            image_size=image_size,
+            strides=strides,
+            grid_sizes=grid_sizes,
+            cell_anchors=cell_anchors,
             pred_boxes=pred_boxes,
-            features=features,
+            feature_map=to_numpy(features[i][0, 66]),
             anchor_sizes=anchor_generator.sizes,
         )
-        anchor_plots[f"P{i+3}"] = {"fig": fig, "fig_stats": fig_stats}
-
-    return anchor_plots
+        for i in range(len(features))
+    ]
 
 
 def plot_pyramid_level_anchors(
@@ -256,7 +256,7 @@ def plot_pyramid_level_anchors(
     grid_sizes,
     cell_anchors,
     pred_boxes,
-    features,
+    feature_map,
     anchor_sizes,
 ):
     """
@@ -266,12 +266,13 @@ def plot_pyramid_level_anchors(
 
     Args:
         pyramide_level_index (int)
-        img (PIL.Image.Image)
-        image_size (torch.Size)
-        strides (List[List[torch.Tensor]])
-        cell_anchors (List[torch.Tensor])
-        pred_boxes (torch.Tensor)
-        features (List[torch.Tensor])
+        img (PIL.Image.Image or np.ndarray)
+        image_size (Tuple[int])
+        strides (List[List[int]])
+        grid_sizes (List[List[int]])
+        cell_anchors (List[np.ndarray])
+        pred_boxes (np.ndarray)
+        feature_map (np.ndarray) - a single channel of this level's feature map
         anchors_sizes (List[tuple])
 
     Returns:
@@ -279,6 +280,10 @@ def plot_pyramid_level_anchors(
 
     """
 
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    image_size = tuple(image_size)
+
     figsize = [round(i / 100) for i in image_size]
     figsize[0] = figsize[0] * 2
     fig, (ax1, ax2) = plt.subplots(nrows=2, ncols=1, figsize=(figsize[::-1]))
@@ -314,11 +319,8 @@ def plot_pyramid_level_anchors(
             ax1.add_patch(patch)
 
     # normalize and resize a feature map for visualization
-    fm = features[pyramid_level_idx][:, 66, :, :].detach().numpy()
-    fm = np.rollaxis(fm, 0, 3)
-    fm_norm = (
-        ((fm - fm.min()) * (1 / (fm.max() - fm.min()) * 255)).astype("uint8").squeeze(2)
-    )
+    fm = to_numpy(feature_map)
+    fm_norm = ((fm - fm.min()) * (1 / (fm.max() - fm.min()) * 255)).astype("uint8")
     fm_img = Image.fromarray(fm_norm).resize(image_size[::-1])
     ax2.grid(True)
     ax2.set_xticks(np.arange(0, image_size[1], strides[pyramid_level_idx][1]))
@@ -335,9 +337,81 @@ def plot_pyramid_level_anchors(
 
     fig_stats = {
         "image_size": list(image_size),
-        "stride": [stride.item() for stride in strides[pyramid_level_idx]],
-        "grid_size": list(grid_sizes[pyramid_level_idx]),
+        "stride": [int(stride) for stride in strides[pyramid_level_idx]],
+        "grid_size": [int(g) for g in grid_sizes[pyramid_level_idx]],
         "anchor_sizes": anchor_sizes[pyramid_level_idx],
     }
 
     return fig, fig_stats
+
+
+FigureTask = collections.namedtuple(
+    "FigureTask", ["name", "plot_fn", "kwargs", "path", "savefig_kwargs"]
+)
+FigureTask.__doc__ = """
+A figure to render: plot_fn(**kwargs) must return a matplotlib Figure, or a
+(Figure, stats) tuple like plot_pyramid_level_anchors, and kwargs should hold
+only plain Python and NumPy objects. The figure is saved as a PNG at path.
+"""
+
+# one pool per worker count, created on first use and shut down at exit
+_render_pools = {}
+_render_pools_lock = threading.Lock()
+
+
+def _init_render_worker():
+    plt.switch_backend("Agg")
+
+
+def _render_figure(task):
+    result = task.plot_fn(**task.kwargs)
+    fig, stats = result if isinstance(result, tuple) else (result, None)
+    fig.savefig(task.path, **task.savefig_kwargs)
+    plt.close(fig)
+    return task.name, task.path, stats
+
+
+def _get_render_pool(num_workers):
+    # workers are spawned rather than forked: the Streamlit server is threaded and
+    # has torch loaded, neither of which is safe to fork
+    with _render_pools_lock:
+        pool = _render_pools.get(num_workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_render_worker,
+            )
+            _render_pools[num_workers] = pool
+        return pool
+
+
+@atexit.register
+def _shutdown_render_pools():
+    with _render_pools_lock:
+        for pool in _render_pools.values():
+            pool.shutdown()
+        _render_pools.clear()
+
+
+def render_figures(tasks, num_workers=None):
+    """
+    Builds and saves a list of FigureTasks, spreading them over a pool of worker
+    processes that render with the non-interactive Agg backend. The pool is kept
+    alive between calls, shared by every thread, and shut down at exit.
+    num_workers=0 renders serially in this process instead.
+
+    Returns:
+        results (dict) - maps each task name to a (path, stats) tuple
+
+    """
+
+    if num_workers == 0:
+        return {name: (path, stats) for name, path, stats in map(_render_figure, tasks)}
+
+    return {
+        name: (path, stats)
+        for name, path, stats in _get_render_pool(num_workers).map(
+            _render_figure, tasks
+        )
+    }
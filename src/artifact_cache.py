@@ -0,0 +1,311 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+from src.retinanet import model_urls
+from src.artifact_store import ArtifactStore, MANIFEST_FILENAME, write_data_artifacts
+
+# folder holding one subfolder of artifacts per cached upload
+CACHE_DIR_ENV = "RETINANET_CACHE_DIR"
+DEFAULT_CACHE_DIR = "data/cache"
+
+# upper bound on the total size of the cache on disk, least recently used
+# entries are evicted beyond it
+CACHE_MAX_MB_ENV = "RETINANET_CACHE_MAX_MB"
+DEFAULT_CACHE_MAX_MB = 512
+
+# bump whenever gather_data_artifacts or the figures it renders change so that
+# entries written by older code are never served
+ARTIFACT_VERSION = 1
+
+IMAGE_FILENAME = "image.jpg"
+
+# entries a session prepared or viewed within this many seconds are pinned and
+# never evicted, and neither are entries still being written that recently
+DEFAULT_PIN_TTL_S = 3600
+
+_file_hashes = {}
+
+
+def bytes_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_preset(image_hash, preset_images):
+    """
+    Returns the name of the preset image whose file content hashes to image_hash,
+    or None. Preset file hashes are computed once per process.
+
+    """
+
+    for name, path in preset_images.items():
+        if path not in _file_hashes:
+            with open(path, "rb") as f:
+                _file_hashes[path] = bytes_sha256(f.read())
+        if _file_hashes[path] == image_hash:
+            return name
+    return None
+
+
+def cache_key(image_hash, model_version=None, artifact_version=ARTIFACT_VERSION):
+    """
+    Combines the hash of the uploaded image bytes with the model weights and the
+    artifact code version, so the same image maps to a new entry whenever
+    either of them changes.
+
+    """
+
+    if model_version is None:
+        model_version = os.path.basename(model_urls["retinanet_resnet50_fpn_coco"])
+    key = f"{image_hash}:{model_version}:{artifact_version}"
+    return bytes_sha256(key.encode())[:32]
+
+
+def _dir_size(path):
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+class ArtifactCache(object):
+    """
+    Content-addressed, size-bounded disk cache of the artifacts gathered for an
+    uploaded image.
+
+    Each entry is a folder named by cache_key() holding the uploaded image and an
+    ArtifactStore with the rendered fpn/rpn/nms figures, detections, feature
+    samples and figure stats. An entry only counts as complete once the store's
+    manifest exists, and the manifest's modification time tracks the last use
+    and drives LRU eviction. Eviction skips entries that are pinned by a session
+    or still being written.
+
+    Args:
+        root - cache folder, defaults to $RETINANET_CACHE_DIR or data/cache
+        max_bytes - total size above which the least recently used entries
+            are removed, defaults to $RETINANET_CACHE_MAX_MB megabytes
+        pin_ttl - seconds a pin, or an entry still being written, protects the
+            entry from eviction
+    """
+
+    def __init__(self, root=None, max_bytes=None, pin_ttl=DEFAULT_PIN_TTL_S):
+        if root is None:
+            root = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_mb = os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB)
+            max_bytes = int(float(max_mb) * 2**20)
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pin_ttl = pin_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pins = {}
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def image_path(self, key):
+        return os.path.join(self.entry_dir(key), IMAGE_FILENAME)
+
+    def pin(self, key):
+        """
+        Marks the entry for key as in use by a session, protecting it from
+        eviction for pin_ttl seconds. Sessions pin again on every page they show.
+
+        """
+
+        with self._lock:
+            self._pins[key] = time.time()
+
+    def _pinned_keys(self, now):
+        self._pins = {
+            key: pinned_at
+            for key, pinned_at in self._pins.items()
+            if now - pinned_at < self.pin_ttl
+        }
+        return set(self._pins)
+
+    def prepare_entry(self, key, image):
+        """
+        Creates the folder structure of an entry and saves the uploaded PIL image
+        into it as a JPEG, unless the entry already exists.
+
+        Returns:
+            image_path (str)
+
+        """
+
+        self.pin(key)
+        entry_dir = self.entry_dir(key)
+        for subdir in ["fpn", "rpn", "nms"]:
+            os.makedirs(os.path.join(entry_dir, subdir), exist_ok=True)
+
+        image_path = self.image_path(key)
+        if not os.path.exists(image_path):
+            tmp_path = f"{image_path}.{os.getpid()}.tmp"
+            image.convert("RGB").save(tmp_path, "jpeg")
+            os.replace(tmp_path, image_path)
+        return image_path
+
+    def load(self, key):
+        """
+        Returns the ArtifactStore of the entry for key, or None on a miss. A hit
+        marks the entry as most recently used and pins it.
+
+        """
+
+        store = ArtifactStore(self.entry_dir(key))
+        try:
+            os.utime(store.manifest_path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.pin(key)
+        return store
+
+    def store(self, key, data_artifacts):
+        """
+        Saves the output of gather_data_artifacts() into the entry for key and
+        enforces max_bytes.
+
+        Returns:
+            store (ArtifactStore)
+
+        """
+
+        store = write_data_artifacts(data_artifacts, self.entry_dir(key))
+        self.evict(keep=(key,))
+        return store
+
+    def entries(self):
+        """
+        Lists the cached entries as (last_used, size_bytes, key) tuples, least
+        recently used first. Entries still being prepared use their folder's
+        modification time.
+
+        """
+
+        if not os.path.isdir(self.root):
+            return []
+
+        entries = []
+        for key in os.listdir(self.root):
+            entry_dir = self.entry_dir(key)
+            if not os.path.isdir(entry_dir):
+                continue
+            try:
+                last_used = os.path.getmtime(os.path.join(entry_dir, MANIFEST_FILENAME))
+            except OSError:
+                last_used = os.path.getmtime(entry_dir)
+            entries.append((last_used, _dir_size(entry_dir), key))
+        return sorted(entries)
+
+    def evict(self, keep=()):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        Keys in keep, pinned keys and entries whose manifest has not been written
+        yet, unless they were abandoned more than pin_ttl seconds ago, are never
+        removed.
+
+        Returns:
+            evicted (List[str]) - keys of the removed entries
+
+        """
+
+        with self._lock:
+            now = time.time()
+            keep = set(keep) | self._pinned_keys(now)
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            evicted = []
+            for last_used, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    continue
+                in_progress = not os.path.exists(
+                    os.path.join(self.entry_dir(key), MANIFEST_FILENAME)
+                )
+                if in_progress and now - last_used < self.pin_ttl:
+                    continue
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+                total -= size
+                evicted.append(key)
+        return evicted
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_artifact_cache():
+    """Returns the process-wide ArtifactCache, creating it on first use"""
+
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ArtifactCache()
+    return _CACHE
@@ -0,0 +1,210 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import json
+
+import numpy as np
+
+MANIFEST_FILENAME = "manifest.json"
+
+# bump whenever the layout of a store changes
+STORE_VERSION = 1
+
+
+def _to_json(obj):
+    """Converts tuples and NumPy scalars/arrays into plain JSON types"""
+
+    if isinstance(obj, dict):
+        return {str(k): _to_json(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_json(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+class ArtifactStore(object):
+    """
+    Folder of app artifacts that are saved individually and loaded on demand.
+
+    A manifest.json in the folder lists every artifact with its format and file:
+    "json" for small stats, "npz" for groups of arrays and "png" for rendered
+    figures. Only the manifest is read when an artifact is first requested, and
+    each artifact file is read the first time it is loaded, so a page pays only
+    for what it displays. The manifest is written last by write_manifest(), so a
+    store counts as complete once it exists.
+
+    Args:
+        root - folder holding the store
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._manifest = None
+        self._loaded = {}
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_FILENAME)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            if self.exists():
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {"version": STORE_VERSION, "artifacts": {}}
+        return self._manifest
+
+    def __contains__(self, name):
+        return name in self.manifest["artifacts"]
+
+    def _add(self, name, fmt, filename):
+        self.manifest["artifacts"][name] = {"format": fmt, "path": filename}
+        self._loaded.pop(name, None)
+
+    def save_json(self, name, obj):
+        filename = f"{name}.json"
+        with open(os.path.join(self.root, filename), "w") as f:
+            json.dump(_to_json(obj), f)
+        self._add(name, "json", filename)
+
+    def save_arrays(self, name, arrays):
+        """Saves a dict of arrays with string keys as one compressed .npz file"""
+
+        filename = f"{name}.npz"
+        np.savez_compressed(
+            os.path.join(self.root, filename),
+            **{str(k): np.asarray(v) for k, v in arrays.items()},
+        )
+        self._add(name, "npz", filename)
+
+    def add_figure(self, name, path):
+        """Registers an already rendered figure, stored relative to root"""
+
+        self._add(name, "png", os.path.relpath(path, self.root))
+
+    def write_manifest(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def figure_path(self, name):
+        return os.path.join(self.root, self.manifest["artifacts"][name]["path"])
+
+    def load(self, name):
+        """
+        Loads a json or npz artifact, reading its file only the first time.
+        Arrays are returned as a dict of NumPy arrays.
+
+        """
+
+        if name not in self._loaded:
+            entry = self.manifest["artifacts"][name]
+            path = os.path.join(self.root, entry["path"])
+            if entry["format"] == "json":
+                with open(path) as f:
+                    self._loaded[name] = json.load(f)
+            elif entry["format"] == "npz":
+                with np.load(path) as arrays:
+                    self._loaded[name] = dict(arrays)
+            else:
+                raise ValueError(f"{name} is a {entry['format']} artifact")
+        return self._loaded[name]
+
+
+def write_data_artifacts(data_artifacts, root):
+    """
+    Saves the output of gather_data_artifacts() as an ArtifactStore in root, the
+    same folder the figures were rendered into.
+
+    Artifacts:
+        summary (json) - number of detections and image size
+        anchor_stats (json) - fig_stats of each pyramid level
+        detections (npz) - boxes, scores and labels
+        feature_samples (npz) - sampled feature maps of each pyramid level
+        fpn, rpn/P3 ... rpn/P7, nms/with_nms, nms/without_nms (png) - figures
+
+    Returns:
+        store (ArtifactStore)
+
+    """
+
+    store = ArtifactStore(root)
+    outputs = {
+        k: v.detach().cpu().numpy() if hasattr(v, "detach") else np.asarray(v)
+        for k, v in data_artifacts["outputs"].items()
+    }
+
+    store.save_json(
+        "summary",
+        {
+            "num_detections": len(outputs["boxes"]),
+            "image_size": list(data_artifacts["image"].size),
+        },
+    )
+    store.save_json(
+        "anchor_stats",
+        {level: d["fig_stats"] for level, d in data_artifacts["anchor_plots"].items()},
+    )
+    store.save_arrays("detections", outputs)
+    store.save_arrays(
+        "feature_samples",
+        {
+            f"P{i+3}": samples
+            for i, samples in data_artifacts["feature_samples"].items()
+        },
+    )
+
+    fig_paths = data_artifacts["fig_paths"]
+    store.add_figure("fpn", fig_paths["fpn"])
+    for group in ["rpn", "nms"]:
+        for name, path in fig_paths[group].items():
+            store.add_figure(f"{group}/{name}", path)
+
+    store.write_manifest()
+    return store
@@ -39,69 +39,124 @@
 # ###########################################################################
 
 import os
-import pickle
+
+import numpy as np
 
 from src.model_utils import COCO_LABELS
 from src.model_utils import get_inference_artifacts
-from src.app_utils import get_feature_map_plot, get_anchor_plots, plot_predictions
+from src.app_utils import (
+    FigureTask,
+    render_figures,
+    to_numpy,
+    sample_feature_maps,
+    plot_feature_samples,
+    get_anchor_plot_inputs,
+    plot_pyramid_level_anchors,
+    plot_predictions,
+)
 
 
 def create_directory_structure(dirname):
-    """ Builds skeleton folder structure to hold artifacts used in the app"""
+    """Builds skeleton folder structure to hold artifacts used in the app"""
 
     os.makedirs(f"data/{dirname}")
     for subdir in ["fpn", "rpn", "nms"]:
         os.makedirs(f"data/{dirname}/{subdir}")
 
 
-def gather_data_artifacts(img_path):
+def gather_data_artifacts(img_path, output_dir, num_workers=None):
     """
     Uses specified image path to load the image and gather all data artifacts to be used
     throughout the app.
 
+    Inference runs once in this process. The feature map, anchor and prediction
+    figures are then built from NumPy copies of its results and saved as PNGs under
+    output_dir (in the fpn, rpn and nms subfolders) by a pool of worker processes.
+
     Args:
         img_path
+        output_dir - folder created by create_directory_structure()
+        num_workers - number of rendering processes, 0 renders in this process
 
     Returns:
         data_artifacts
 
     """
 
-    inference_artifacts = get_inference_artifacts(img_path, False)
-    feature_map_figure = get_feature_map_plot(inference_artifacts["model"])
-    anchor_plots = get_anchor_plots(
-        inference_artifacts["image"],
-        inference_artifacts["model"].anchor_generator,
-        inference_artifacts["outputs"]["boxes"],
-        inference_artifacts["model"].viz_artifacts["features"],
-    )
-    prediction_figures = {
-        k: plot_predictions(
-            image=inference_artifacts["image"],
-            outputs=inference_artifacts["outputs"],
-            label_map=COCO_LABELS,
-            nms_off=False if k == "with_nms" else True,
+    inference_artifacts = get_inference_artifacts(img_path)
+    model = inference_artifacts["model"]
+    image = np.asarray(inference_artifacts["image"].convert("RGB"))
+    viz_artifacts = inference_artifacts["viz_artifacts"]
+    features = viz_artifacts["features"]
+
+    feature_samples = sample_feature_maps(features, 7)
+
+    tasks = [
+        FigureTask(
+            name="fpn",
+            plot_fn=plot_feature_samples,
+            kwargs={"samples": feature_samples},
+            path=os.path.join(output_dir, "fpn", "feature_map_fig.png"),
+            savefig_kwargs={"bbox_inches": "tight"},
+        )
+    ]
+    for i, kwargs in enumerate(
+        get_anchor_plot_inputs(
+            image,
+            model.anchor_generator,
+            inference_artifacts["outputs"]["boxes"],
+            features,
+            anchor_artifacts=viz_artifacts["anchor_artifacts"],
         )
-        for k in ["with_nms", "without_nms"]
+    ):
+        tasks.append(
+            FigureTask(
+                name=f"P{i+3}",
+                plot_fn=plot_pyramid_level_anchors,
+                kwargs=kwargs,
+                path=os.path.join(output_dir, "rpn", f"P{i+3}.png"),
+                savefig_kwargs={},
+            )
+        )
+    for nms_setting, outputs_key in [
+        ("with_nms", "outputs"),
+        ("without_nms", "outputs_without_nms"),
+    ]:
+        tasks.append(
+            FigureTask(
+                name=nms_setting,
+                plot_fn=plot_predictions,
+                kwargs={
+                    "image": image,
+                    "outputs": {
+                        k: to_numpy(v)
+                        for k, v in inference_artifacts[outputs_key].items()
+                    },
+                    "label_map": COCO_LABELS,
+                    "nms_off": nms_setting == "without_nms",
+                },
+                path=os.path.join(output_dir, "nms", f"{nms_setting}.png"),
+                savefig_kwargs={},
+            )
+        )
+
+    rendered = render_figures(tasks, num_workers=num_workers)
+
+    fig_paths = {
+        "fpn": rendered["fpn"][0],
+        "rpn": {f"P{i+3}": rendered[f"P{i+3}"][0] for i in range(len(features))},
+        "nms": {k: rendered[k][0] for k in ["with_nms", "without_nms"]},
+    }
+    anchor_plots = {
+        f"P{i+3}": {"fig_stats": rendered[f"P{i+3}"][1]} for i in range(len(features))
     }
 
     data_artifacts = {
         "outputs": inference_artifacts["outputs"],
         "image": inference_artifacts["image"],
-        "feature_map_fig": feature_map_figure,
+        "feature_samples": feature_samples,
         "anchor_plots": anchor_plots,
-        "prediction_figures": prediction_figures,
+        "fig_paths": fig_paths,
     }
 
     return data_artifacts
-
-
-def create_pickle(obj, filepath):
-    with open(filepath, "wb") as f:
-        pickle.dump(obj, f)
-
-
-def load_pickle(filepath):
-    with open(filepath, "rb") as f:
-        obj = pickle.load(f)
-    return obj
\ No newline at end of file
@@ -0,0 +1,392 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import json
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+from torch.jit.annotations import Dict, List
+from torchvision.models.detection import _utils as det_utils
+from torchvision.ops import boxes as box_ops
+
+from src.model_utils import COCO_LABELS
+from src.retinanet import _inverse_sigmoid, _rank_within_class
+
+METADATA_FILENAME = "metadata.json"
+ONNX_INPUT_NAME = "images"
+ONNX_OUTPUT_NAMES = ["cls_logits", "bbox_regression"]
+
+
+class InferenceCore(nn.Module):
+    """Backbone and head of a RetinaNet, returning (cls_logits, bbox_regression)"""
+
+    def __init__(self, backbone, head):
+        super().__init__()
+        self.backbone = backbone
+        self.head = head
+
+    def forward(self, images):
+        features = list(self.backbone(images).values())
+        head_outputs = self.head(features)
+        return head_outputs["cls_logits"], head_outputs["bbox_regression"]
+
+
+class ExportedRetinaNet(nn.Module):
+    """
+    TorchScript friendly RetinaNet inference for one fixed padded input size.
+
+    Images are normalized and resized exactly like GeneralizedRCNNTransform, then
+    copied into a zero canvas of input_size, so the traced backbone and head always
+    see the same shape and the anchors can be stored as a constant. Postprocessing
+    follows RetinaNet.postprocess_detections with NMS on, and boxes are returned
+    in the coordinates of the original images.
+
+    None of the visualization artifact capture, instrumentation or nms_off
+    handling of RetinaNet.forward is included.
+
+    Arguments:
+        core (ScriptModule): traced InferenceCore
+        anchors (Tensor): anchors of the padded input size, (num_anchors, 4)
+        num_anchors_per_level (list[int])
+        input_size (Tuple[int, int]): (height, width) of the padded input
+        transform (GeneralizedRCNNTransform): provides min/max size, mean and std
+        score_thresh, nms_thresh, detections_per_img, topk_candidates: as in RetinaNet
+    """
+
+    __annotations__ = {
+        "box_coder": det_utils.BoxCoder,
+    }
+
+    def __init__(
+        self,
+        core,
+        anchors,
+        num_anchors_per_level,
+        input_size,
+        transform,
+        score_thresh,
+        nms_thresh,
+        detections_per_img,
+        topk_candidates,
+    ):
+        super().__init__()
+        self.core = core
+        self.register_buffer("anchors", anchors)
+        self.register_buffer(
+            "image_mean", torch.tensor(transform.image_mean).view(-1, 1, 1)
+        )
+        self.register_buffer(
+            "image_std", torch.tensor(transform.image_std).view(-1, 1, 1)
+        )
+
+        self.num_anchors_per_level = [int(n) for n in num_anchors_per_level]
+        self.input_size = [int(input_size[0]), int(input_size[1])]
+        self.min_size = float(transform.min_size[-1])
+        self.max_size = float(transform.max_size)
+
+        self.logit_thresh = _inverse_sigmoid(score_thresh)
+        self.nms_thresh = float(nms_thresh)
+        self.detections_per_img = int(detections_per_img)
+        # 0 keeps every candidate above the score threshold
+        self.topk_candidates = int(topk_candidates or 0)
+        self.box_coder = det_utils.BoxCoder(weights=(1.0, 1.0, 1.0, 1.0))
+
+    def resize(self, image: Tensor) -> Tensor:
+        height, width = image.shape[-2], image.shape[-1]
+        scale = self.min_size / float(min(height, width))
+        if float(max(height, width)) * scale > self.max_size:
+            scale = self.max_size / float(max(height, width))
+        return F.interpolate(
+            image[None],
+            scale_factor=scale,
+            mode="bilinear",
+            recompute_scale_factor=True,
+            align_corners=False,
+        )[0]
+
+    def postprocess_image(
+        self, logits: Tensor, box_regression: Tensor, image_size: List[int]
+    ) -> Dict[str, Tensor]:
+        num_classes = logits.shape[-1]
+
+        candidate_idxs = []
+        offset = 0
+        for logits_per_level in logits.split(self.num_anchors_per_level):
+            logits_per_level = logits_per_level.flatten()
+            keep_idxs = torch.where(logits_per_level > self.logit_thresh)[0]
+            if self.topk_candidates > 0:
+                num_topk = min(self.topk_candidates, keep_idxs.size(0))
+                _, order = logits_per_level[keep_idxs].topk(num_topk)
+                keep_idxs = keep_idxs[order]
+            candidate_idxs.append(keep_idxs + offset)
+            offset += logits_per_level.size(0)
+
+        candidates = torch.cat(candidate_idxs)
+        anchor_idxs = torch.div(candidates, num_classes, rounding_mode="floor")
+
+        boxes = self.box_coder.decode_single(
+            box_regression[anchor_idxs], self.anchors[anchor_idxs]
+        )
+        boxes = box_ops.clip_boxes_to_image(boxes, (image_size[0], image_size[1]))
+        scores = torch.sigmoid(logits.flatten()[candidates])
+        labels = candidates % num_classes
+
+        keep = box_ops.remove_small_boxes(boxes, min_size=1e-2)
+        keep = keep[
+            box_ops.batched_nms(
+                boxes[keep], scores[keep], labels[keep], self.nms_thresh
+            )
+        ]
+        keep = keep[_rank_within_class(labels[keep]) < self.detections_per_img]
+
+        positions = torch.arange(keep.numel(), device=keep.device)
+        keep = keep[torch.argsort(labels[keep] * keep.numel() + positions)]
+
+        return {"boxes": boxes[keep], "scores": scores[keep], "labels": labels[keep]}
+
+    def forward(self, images: List[Tensor]) -> List[Dict[str, Tensor]]:
+        batch = torch.zeros(
+            len(images),
+            3,
+            self.input_size[0],
+            self.input_size[1],
+            dtype=self.anchors.dtype,
+            device=self.anchors.device,
+        )
+
+        original_sizes: List[List[int]] = []
+        image_sizes: List[List[int]] = []
+        for i, image in enumerate(images):
+            original_sizes.append([image.shape[-2], image.shape[-1]])
+            image = self.resize((image - self.image_mean) / self.image_std)
+            height, width = image.shape[-2], image.shape[-1]
+            if height > self.input_size[0] or width > self.input_size[1]:
+                raise ValueError(
+                    "Resized image does not fit the exported input size, export "
+                    "again for this aspect ratio"
+                )
+            batch[i, :, :height, :width].copy_(image)
+            image_sizes.append([height, width])
+
+        cls_logits, bbox_regression = self.core(batch)
+
+        detections: List[Dict[str, Tensor]] = []
+        for i in range(len(images)):
+            detection = self.postprocess_image(
+                cls_logits[i], bbox_regression[i], image_sizes[i]
+            )
+            ratio_height = float(original_sizes[i][0]) / float(image_sizes[i][0])
+            ratio_width = float(original_sizes[i][1]) / float(image_sizes[i][1])
+            ratios = torch.tensor(
+                [ratio_width, ratio_height, ratio_width, ratio_height],
+                dtype=detection["boxes"].dtype,
+                device=detection["boxes"].device,
+            )
+            detection["boxes"] = detection["boxes"] * ratios
+            detections.append(detection)
+        return detections
+
+
+def padded_input_size(model, image_shape):
+    """
+    Returns the (height, width) that model.transform resizes and pads an image of
+    image_shape (height, width) to, i.e. the input size to export for it
+    """
+
+    was_training = model.transform.training
+    model.transform.eval()
+    try:
+        image = torch.zeros(3, int(image_shape[0]), int(image_shape[1]))
+        return tuple(int(s) for s in model.transform([image])[0].tensors.shape[-2:])
+    finally:
+        model.transform.train(was_training)
+
+
+@torch.no_grad()
+def export_torchscript(model, input_size, freeze=True):
+    """
+    Traces the backbone and head of an eval-mode RetinaNet at input_size, wraps
+    them in ExportedRetinaNet and scripts the result.
+
+    Args:
+        model - RetinaNet, optionally with a fused head or resolution preset
+        input_size - padded (height, width), see padded_input_size()
+        freeze - fold the weights into the graph with torch.jit.freeze
+
+    Returns:
+        module (torch.jit.ScriptModule)
+    """
+
+    model.eval()
+    param = next(model.parameters())
+    input_size = (int(input_size[0]), int(input_size[1]))
+
+    grid_sizes = model.feature_grid_sizes(input_size)
+    anchors = model.anchor_generator.precompute(
+        input_size, grid_sizes, param.dtype, param.device
+    ).clone()
+    num_anchors_per_location = model.anchor_generator.num_anchors_per_location()[0]
+    num_anchors_per_level = [h * w * num_anchors_per_location for h, w in grid_sizes]
+
+    head = model.fused_head if model.fused_head is not None else model.head
+    example = torch.zeros(1, 3, *input_size, dtype=param.dtype, device=param.device)
+    core = torch.jit.trace(InferenceCore(model.backbone, head).eval(), example)
+
+    module = ExportedRetinaNet(
+        core,
+        anchors,
+        num_anchors_per_level,
+        input_size,
+        model.transform,
+        model.score_thresh,
+        model.nms_thresh,
+        model.detections_per_img,
+        model.topk_candidates,
+    )
+    module = torch.jit.script(module.eval())
+    if freeze:
+        module = torch.jit.freeze(module)
+    return module
+
+
+def save_exported(module, path, **metadata):
+    """
+    Saves an exported module along with a metadata.json extra file holding the
+    given fields and the COCO label names, so that it can be run without src
+    """
+
+    metadata = dict(metadata, labels=COCO_LABELS)
+    torch.jit.save(module, path, _extra_files={METADATA_FILENAME: json.dumps(metadata)})
+
+
+def load_exported(path, map_location="cpu"):
+    """
+    Returns (module, metadata) for a file written by save_exported. The loader in
+    scripts/run_torchscript.py does the same without importing src.
+    """
+
+    extra_files = {METADATA_FILENAME: ""}
+    module = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    return module, json.loads(extra_files[METADATA_FILENAME])
+
+
+@torch.no_grad()
+def export_onnx(model, path, input_size=(800, 1216), opset_version=11):
+    """
+    Writes the backbone, FPN and head of an eval-mode RetinaNet to ONNX, from the
+    padded image batch up to the raw cls_logits and bbox_regression. Batch size,
+    height and width are left dynamic, anchors and postprocessing stay in Python,
+    see OnnxRuntimeBackend.
+
+    Args:
+        model - RetinaNet without a fused head. FusedRetinaNetHead lays out its
+            outputs with offsets computed in Python, which tracing would freeze
+            to the example input size despite the dynamic axes
+        path - output .onnx file
+        input_size - padded (height, width) of the example input used for tracing
+        opset_version - ONNX opset, 11 is the lowest covering the FPN upsampling
+    """
+
+    if model.fused_head is not None:
+        raise ValueError(
+            "export_onnx does not support a fused head, its output layout is only "
+            "valid at the traced input size. Export the regular head instead"
+        )
+
+    model.eval()
+    param = next(model.parameters())
+    example = torch.zeros(1, 3, *input_size, dtype=param.dtype, device=param.device)
+
+    torch.onnx.export(
+        InferenceCore(model.backbone, model.head).eval(),
+        example,
+        path,
+        input_names=[ONNX_INPUT_NAME],
+        output_names=ONNX_OUTPUT_NAMES,
+        dynamic_axes=dict(
+            {ONNX_INPUT_NAME: {0: "batch", 2: "height", 3: "width"}},
+            **{name: {0: "batch", 1: "anchors"} for name in ONNX_OUTPUT_NAMES},
+        ),
+        opset_version=opset_version,
+    )
+
+
+class OnnxRuntimeBackend:
+    """
+    Runs a graph written by export_onnx() on ONNX Runtime. Pass it as backend= to
+    RetinaNet.forward or predict() to replace the PyTorch backbone and head.
+
+    Arguments:
+        path (str): .onnx file written by export_onnx()
+        num_threads (int): intra-op threads of the session, ONNX Runtime's default
+            when None
+        providers (list[str]): execution providers, in order of preference
+    """
+
+    def __init__(self, path, num_threads=None, providers=("CPUExecutionProvider",)):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(
+                "The ONNX backend requires onnxruntime: pip3 install onnxruntime"
+            )
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self.path = path
+        self.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=list(providers)
+        )
+
+    def __call__(self, images):
+        outputs = self.session.run(
+            ONNX_OUTPUT_NAMES,
+            {ONNX_INPUT_NAME: images.detach().cpu().numpy()},
+        )
+        return {
+            name: torch.from_numpy(output).to(images.device)
+            for name, output in zip(ONNX_OUTPUT_NAMES, outputs)
+        }
@@ -0,0 +1,275 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import time
+import logging
+import threading
+import collections
+
+import torch
+
+from src.model_registry import resident_memory_bytes
+
+# stages RetinaNet.forward reports when an Instrumentation is attached
+STAGES = (
+    "transform",
+    "backbone",
+    "head",
+    "anchors",
+    "postprocess",
+    "transform_postprocess",
+)
+
+StageEvent = collections.namedtuple(
+    "StageEvent",
+    [
+        "stage",
+        "start_time",
+        "duration_s",
+        "allocated_bytes",
+        "output_bytes",
+        "output_shapes",
+    ],
+)
+StageEvent.__doc__ = """
+One instrumented stage of a forward pass
+
+    stage           - name of the stage, one of STAGES
+    start_time      - time.time() when the stage started
+    duration_s      - wall-clock duration of the stage
+    allocated_bytes - growth in CUDA allocated memory, or process RSS on CPU
+    output_bytes    - bytes held by the tensors the stage returned
+    output_shapes   - shapes of those tensors, in the structure they were returned
+"""
+
+
+def _summarize_outputs(outputs):
+    """Returns (shapes, bytes) of every tensor in a nested output structure"""
+
+    if isinstance(outputs, torch.Tensor):
+        return list(outputs.shape), outputs.numel() * outputs.element_size()
+    if hasattr(outputs, "tensors") and hasattr(outputs, "image_sizes"):
+        # torchvision ImageList
+        return _summarize_outputs(outputs.tensors)
+    if isinstance(outputs, dict):
+        summaries = {k: _summarize_outputs(v) for k, v in outputs.items()}
+        return (
+            {k: shapes for k, (shapes, _) in summaries.items()},
+            sum(num_bytes for _, num_bytes in summaries.values()),
+        )
+    if isinstance(outputs, (list, tuple)):
+        summaries = [_summarize_outputs(v) for v in outputs]
+        return (
+            [shapes for shapes, _ in summaries],
+            sum(num_bytes for _, num_bytes in summaries),
+        )
+    return None, 0
+
+
+class Instrumentation(object):
+    """
+    Measures the stages of RetinaNet.forward and emits a StageEvent per stage to
+    each sink. Attach it with model.instrumentation = Instrumentation(sinks); a
+    model without one runs each stage with a single extra attribute check.
+
+    Hooks registered with register_hook() are called around every stage:
+    before(stage) and after(event).
+
+    Args:
+        sinks - objects with an emit(event) method, e.g. LoggingSink,
+            PrometheusTextfileSink, RingBufferSink
+        record_shapes - collect output shapes and bytes for every event
+    """
+
+    def __init__(self, sinks=(), record_shapes=True):
+        self.sinks = list(sinks)
+        self.record_shapes = record_shapes
+        self._before_hooks = []
+        self._after_hooks = []
+
+    def register_hook(self, before=None, after=None):
+        if before is not None:
+            self._before_hooks.append(before)
+        if after is not None:
+            self._after_hooks.append(after)
+
+    def _allocated_bytes(self, device):
+        if device is not None and device.type == "cuda":
+            return torch.cuda.memory_allocated(device)
+        return resident_memory_bytes()
+
+    def run(self, stage, fn, *args, device=None):
+        """Calls fn(*args) as the given stage and emits its StageEvent"""
+
+        for hook in self._before_hooks:
+            hook(stage)
+
+        allocated_before = self._allocated_bytes(device)
+        start_time = time.time()
+        start = time.perf_counter()
+
+        outputs = fn(*args)
+
+        if device is not None and device.type == "cuda":
+            torch.cuda.synchronize(device)
+        duration = time.perf_counter() - start
+        allocated = self._allocated_bytes(device) - allocated_before
+
+        shapes, output_bytes = (
+            _summarize_outputs(outputs) if self.record_shapes else (None, 0)
+        )
+        event = StageEvent(stage, start_time, duration, allocated, output_bytes, shapes)
+
+        for hook in self._after_hooks:
+            hook(event)
+        for sink in self.sinks:
+            sink.emit(event)
+
+        return outputs
+
+
+class LoggingSink(object):
+    """Logs one line per stage event"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("retinanet.instrumentation")
+        self.level = level
+
+    def emit(self, event):
+        self.logger.log(
+            self.level,
+            "%s: %.2f ms, allocated %.1f MB, output %.1f MB, shapes %s",
+            event.stage,
+            event.duration_s * 1000,
+            event.allocated_bytes / 2**20,
+            event.output_bytes / 2**20,
+            event.output_shapes,
+        )
+
+
+class RingBufferSink(object):
+    """Keeps the most recent capacity events in memory"""
+
+    def __init__(self, capacity=1000):
+        self._events = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def events(self, stage=None):
+        with self._lock:
+            return [e for e in self._events if stage is None or e.stage == stage]
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+class PrometheusTextfileSink(object):
+    """
+    Aggregates events per stage and writes them in the Prometheus text exposition
+    format, for node_exporter's textfile collector. The file is rewritten
+    atomically every flush_every events.
+    """
+
+    def __init__(self, path, flush_every=1, prefix="retinanet"):
+        self.path = path
+        self.flush_every = flush_every
+        self.prefix = prefix
+
+        self._lock = threading.Lock()
+        self._count = collections.Counter()
+        self._seconds = collections.Counter()
+        self._last_allocated = {}
+        self._last_output = {}
+        self._pending = 0
+
+    def emit(self, event):
+        with self._lock:
+            self._count[event.stage] += 1
+            self._seconds[event.stage] += event.duration_s
+            self._last_allocated[event.stage] = event.allocated_bytes
+            self._last_output[event.stage] = event.output_bytes
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_seconds Wall-clock time spent in each inference stage",
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for stage in sorted(self._count):
+            lines.append(
+                f'{p}_stage_seconds_sum{{stage="{stage}"}} {self._seconds[stage]}'
+            )
+            lines.append(
+                f'{p}_stage_seconds_count{{stage="{stage}"}} {self._count[stage]}'
+            )
+
+        for name, values, help_text in [
+            (
+                "allocated_bytes",
+                self._last_allocated,
+                "Memory growth during the last call",
+            ),
+            (
+                "output_bytes",
+                self._last_output,
+                "Tensor bytes returned by the last call",
+            ),
+        ]:
+            lines.append(f"# HELP {p}_stage_{name} {help_text} of each stage")
+            lines.append(f"# TYPE {p}_stage_{name} gauge")
+            for stage in sorted(values):
+                lines.append(f'{p}_stage_{name}{{stage="{stage}"}} {values[stage]}')
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+        self._pending = 0
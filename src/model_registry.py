@@ -0,0 +1,294 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import copy
+import time
+import resource
+import threading
+from collections import OrderedDict
+
+import torch
+
+from src.retinanet import retinanet_resnet50_fpn, cpu_autocast
+
+# comma separated HEIGHTxWIDTH input shapes whose anchors the process-wide registry
+# precomputes, e.g. "800x1216,608x800"
+ANCHOR_SHAPES_ENV = "RETINANET_ANCHOR_SHAPES"
+
+
+def resident_memory_bytes():
+    """
+    Returns the current resident set size of this process in bytes
+
+    Reads /proc/self/statm where available and falls back to the peak RSS
+    reported by getrusage on platforms without procfs.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry(object):
+    """
+    Process-wide cache of eval-mode RetinaNet models.
+
+    Weights are built and loaded once per (device, dtype, memory format). Every
+    postprocessing configuration (nms_off, score/nms thresholds, detections per
+    image), resolution preset and autocast dtype is served as a lightweight variant
+    that shares those weights, so requesting the same configuration twice returns
+    the very same instance.
+
+    Args:
+        builder - callable returning a RetinaNet, defaults to retinanet_resnet50_fpn
+        anchor_shapes - (height, width) input shapes whose anchors are precomputed
+            when the weights are loaded
+        **builder_kwargs - passed through to the builder on every load
+    """
+
+    def __init__(
+        self, builder=retinanet_resnet50_fpn, anchor_shapes=(), **builder_kwargs
+    ):
+        if not builder_kwargs:
+            builder_kwargs = {"pretrained": True, "pretrained_backbone": True}
+
+        self.builder = builder
+        self.builder_kwargs = builder_kwargs
+        self.anchor_shapes = list(anchor_shapes)
+
+        self._lock = threading.Lock()
+        self._base_models = {}
+        self._models = {}
+        self.load_stats = {}
+
+    def _load_base_model(self, device, dtype, channels_last=False):
+        key = (str(device), dtype, channels_last)
+        if key in self._base_models:
+            return self._base_models[key]
+
+        rss_before = resident_memory_bytes()
+        start = time.perf_counter()
+
+        model = self.builder(**self.builder_kwargs)
+        model.to(device=device, dtype=dtype)
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+        if channels_last:
+            model.use_channels_last()
+        if self.anchor_shapes:
+            model.precompute_anchors(self.anchor_shapes, dtype, device)
+
+        load_time = time.perf_counter() - start
+        rss_after = resident_memory_bytes()
+
+        self._base_models[key] = model
+        self.load_stats[key] = {
+            "load_time_s": load_time,
+            "param_bytes": sum(
+                t.numel() * t.element_size()
+                for t in list(model.parameters()) + list(model.buffers())
+            ),
+            "rss_bytes": rss_after,
+            "rss_delta_bytes": rss_after - rss_before,
+            "weights": getattr(model, "load_info", None),
+        }
+
+        return model
+
+    def get(
+        self,
+        nms_off=False,
+        score_thresh=0.05,
+        nms_thresh=0.5,
+        detections_per_img=300,
+        device="cpu",
+        dtype=torch.float32,
+        preset=None,
+        channels_last=False,
+        autocast_dtype=None,
+    ):
+        """
+        Returns a shared eval-mode RetinaNet for the requested configuration,
+        building the underlying weights on first use. preset selects one of the
+        input resolutions in RESOLUTION_PRESETS, None keeps the builder's own.
+
+        channels_last runs the backbone and head in the NHWC memory format, on a
+        separate copy of the weights. autocast_dtype, e.g. torch.bfloat16, runs them
+        under CPU autocast, which requires torch >= 1.10. Anchors and postprocessing
+        stay in fp32 in every mode.
+
+        Callers must treat the returned model as read-only: the same instance
+        is handed to every caller asking for this configuration.
+        """
+
+        device = torch.device(device)
+        if autocast_dtype is not None:
+            if device.type != "cpu":
+                raise ValueError("autocast_dtype is only supported on CPU")
+            # raises a RuntimeError on torch versions without CPU autocast
+            cpu_autocast(autocast_dtype)
+
+        key = (
+            nms_off,
+            score_thresh,
+            nms_thresh,
+            detections_per_img,
+            str(device),
+            dtype,
+            preset,
+            channels_last,
+            autocast_dtype,
+        )
+
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+
+            base_model = self._load_base_model(device, dtype, channels_last)
+
+            # nms_off and the thresholds only affect postprocessing, and the preset
+            # only swaps the transform, so a shallow copy that shares every weight
+            # with the base model is enough to hold a new configuration
+            model = base_model
+            if preset is not None:
+                model = base_model.with_resolution(preset)
+                if self.anchor_shapes and model is not base_model:
+                    model.precompute_anchors(self.anchor_shapes, dtype, device)
+            model = copy.copy(model)
+            # copy the submodule, parameter and buffer dicts so that setting a
+            # submodule on the variant, e.g. fuse_head(), leaves the base model as is
+            model._modules = OrderedDict(model._modules)
+            model._parameters = OrderedDict(model._parameters)
+            model._buffers = OrderedDict(model._buffers)
+            model.nms_off = nms_off
+            model.score_thresh = score_thresh
+            model.nms_thresh = nms_thresh
+            model.detections_per_img = detections_per_img
+            model.autocast_dtype = autocast_dtype
+
+            self._models[key] = model
+
+        return model
+
+    def stats(self):
+        """
+        Summarizes load time and memory for each set of weights held in the registry
+        """
+
+        return {
+            "num_weight_sets": len(self._base_models),
+            "num_configurations": len(self._models),
+            "rss_bytes": resident_memory_bytes(),
+            "weight_sets": {
+                f"{device}/{str(dtype).replace('torch.', '')}"
+                + ("/channels_last" if channels_last else ""): stats
+                for (device, dtype, channels_last), stats in self.load_stats.items()
+            },
+        }
+
+    def clear(self):
+        """Drops every cached model so that memory can be reclaimed"""
+
+        with self._lock:
+            self._models.clear()
+            self._base_models.clear()
+            self.load_stats.clear()
+
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def parse_anchor_shapes(spec):
+    """
+    Parses a comma separated list of HEIGHTxWIDTH shapes, e.g. "800x1216,608x800"
+
+    Args:
+        spec (str)
+
+    Returns:
+        shapes (list[tuple[int, int]])
+    """
+
+    shapes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            height, width = (int(v) for v in item.lower().split("x"))
+        except ValueError:
+            raise ValueError(
+                f"invalid anchor shape {item!r} in {spec!r}, expected HEIGHTxWIDTH"
+            )
+        shapes.append((height, width))
+    return shapes
+
+
+def get_registry(anchor_shapes=None):
+    """
+    Returns the process-wide ModelRegistry, creating it on first use
+
+    Args:
+        anchor_shapes - (height, width) input shapes whose anchors are precomputed,
+            read from RETINANET_ANCHOR_SHAPES when None. Only used when the
+            registry is created, i.e. by the first call
+    """
+
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            if anchor_shapes is None:
+                anchor_shapes = parse_anchor_shapes(
+                    os.environ.get(ANCHOR_SHAPES_ENV, "")
+                )
+            _REGISTRY = ModelRegistry(anchor_shapes=anchor_shapes)
+    return _REGISTRY
+
+
+def get_model(**kwargs):
+    """Shortcut for get_registry().get(**kwargs)"""
+
+    return get_registry().get(**kwargs)
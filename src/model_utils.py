@@ -39,11 +39,12 @@
 # ###########################################################################
 
 import os
+import torch
 import numpy as np
 from PIL import Image
 from torchvision import transforms
 
-from src.retinanet import retinanet_resnet50_fpn
+from src.model_registry import get_model
 
 COCO_LABELS = [
     "__background__",
@@ -140,7 +141,29 @@ COCO_LABELS = [
 ]
 
 
-def predict(model, image, transform, detection_threshold):
+def threshold_outputs(outputs, detection_threshold):
+    """
+    Keep only the predictions whose confidence score exceeds detection_threshold
+
+    Args:
+        outputs - dict containing boxes, scores, labels for a single image
+        detection_threshold - confidence score for anchorbox predictions to be kept
+
+    Returns:
+        outputs - dict containing the kept boxes, scores, labels
+    """
+
+    idxs = np.where(outputs["scores"] > detection_threshold)
+
+    boxes = outputs["boxes"][idxs]
+    scores = outputs["scores"][idxs]
+    labels = outputs["labels"][idxs]
+    outputs = {"boxes": boxes, "scores": scores, "labels": labels}
+
+    return outputs
+
+
+def predict(model, image, transform, detection_threshold, preset=None, backend=None):
     """
     Use a trained Pytorch detection model to make inference on an input image
 
@@ -149,36 +172,101 @@ def predict(model, image, transform, detection_threshold):
         image - PIL image as RGB format
         transform - torchvision Compose object
         detection_threshold - confidence score for anchorbox predictions to be kept
+        preset - optional resolution preset ("fast", "balanced" or "full") to run at
+        backend - optional callable running the backbone and head instead of model,
+            e.g. an OnnxRuntimeBackend
 
     Returns:
         outputs - dict containing boxes, scores, labels for predictions
     """
 
+    return predict_batch(
+        model,
+        [image],
+        transform,
+        detection_threshold,
+        preset=preset,
+        backend=backend,
+    )[0]
+
+
+def predict_batch(
+    model,
+    images,
+    transform,
+    detection_threshold,
+    batch_size=8,
+    preset=None,
+    backend=None,
+):
+    """
+    Use a trained Pytorch detection model to make inference on a list of images
+
+    Images are sorted by aspect ratio and sent through the model batch_size at a time,
+    so that images sharing a batch pad to a similar shape in GeneralizedRCNNTransform.
+
+    Args:
+        model - Pytorch detetection model
+        images - list of PIL images as RGB format or [C, H, W] tensors in 0-1 range
+        transform - torchvision Compose object applied to PIL images
+        detection_threshold - confidence score for anchorbox predictions to be kept
+        batch_size - maximum number of images per forward pass
+        preset - optional resolution preset ("fast", "balanced" or "full") to run at,
+            see RESOLUTION_PRESETS in src/retinanet.py
+        backend - optional callable running the backbone and head instead of model,
+            e.g. an OnnxRuntimeBackend from src/export_utils.py. Anchors and
+            postprocessing still run in model
+
+    Returns:
+        outputs - list of dicts containing boxes, scores, labels, in the order of images
+    """
+
     if model.training:
         model.eval()
+    if preset is not None:
+        model = model.with_resolution(preset)
 
-    image = transform(image).unsqueeze(0)
-    outputs = model(image)[0]
+    tensors = [
+        image if isinstance(image, torch.Tensor) else transform(image)
+        for image in images
+    ]
 
-    idxs = np.where(outputs["scores"] > detection_threshold)
+    # group images of similar aspect ratio (width / height) to limit padding waste
+    order = sorted(
+        range(len(tensors)), key=lambda i: tensors[i].shape[-1] / tensors[i].shape[-2]
+    )
 
-    boxes = outputs["boxes"][idxs]
-    scores = outputs["scores"][idxs]
-    labels = outputs["labels"][idxs]
-    outputs = {"boxes": boxes, "scores": scores, "labels": labels}
+    outputs = [None] * len(tensors)
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            batch_idxs = order[start : start + batch_size]
+            batch_outputs = model([tensors[i] for i in batch_idxs], backend=backend)
+
+            for i, image_outputs in zip(batch_idxs, batch_outputs):
+                outputs[i] = threshold_outputs(image_outputs, detection_threshold)
 
     return outputs
 
 
-def get_inference_artifacts(img_path, nms_off=False):
+def get_inference_artifacts(img_path, capture=("features",), preset=None):
     """
     Given an image path, this function makes inference on the image and returns
-    both the outputs and the model (with saved artifacts)
+    the outputs along with the artifacts captured during that forward pass
+
+    Detections with and without NMS are both derived from a single backbone and
+    head pass: the captured head outputs are postprocessed a second time with
+    NMS turned off.
+
+    The model is fetched from the process-wide registry, so it is only built
+    on the first call and shared by every call after that. The captured artifacts
+    are therefore returned under "viz_artifacts" rather than kept on the model,
+    which callers must treat as read-only. Only the artifact kinds listed in
+    capture are returned, along with the anchor grid sizes, image size and strides
+    under "anchor_artifacts". preset selects one of the input resolutions in
+    RESOLUTION_PRESETS.
     """
 
-    retinanet = retinanet_resnet50_fpn(
-        pretrained=True, pretrained_backbone=True, nms_off=nms_off
-    )
+    retinanet = get_model(preset=preset)
 
     transform = transforms.Compose(
         [
@@ -188,19 +276,37 @@ def get_inference_artifacts(img_path, nms_off=False):
 
     img = Image.open(img_path)
 
-    # resize image to fullsize according to RetinaNet min/max transform
+    # resize image to the size RetinaNet's min/max transform runs the model at
     full_size = retinanet.transform(transform(img).unsqueeze(0))[0].tensors.size()[2:][
         ::-1
     ]
     img = img.resize(full_size)
 
-    outputs = predict(
-        model=retinanet,
-        image=img,
-        transform=transform,
-        detection_threshold=0.7,
-    )
+    postprocess_kinds = ["images", "head_outputs", "anchors"]
+    artifacts = {}
+    with torch.no_grad():
+        outputs = retinanet(
+            [transform(img)],
+            capture=set(capture) | set(postprocess_kinds),
+            artifacts=artifacts,
+        )[0]
+        outputs_without_nms = retinanet.postprocess_artifacts(
+            [(img.size[1], img.size[0])], nms_off=True, artifacts=artifacts
+        )[0]
+    outputs = threshold_outputs(outputs, 0.7)
+    outputs_without_nms = threshold_outputs(outputs_without_nms, 0.7)
+
+    # drop the artifacts only needed for the second postprocessing pass
+    for kind in postprocess_kinds:
+        if kind not in capture:
+            artifacts.pop(kind)
 
-    inference_artifacts = {"outputs": outputs, "model": retinanet, "image": img}
+    inference_artifacts = {
+        "outputs": outputs,
+        "outputs_without_nms": outputs_without_nms,
+        "viz_artifacts": artifacts,
+        "model": retinanet,
+        "image": img,
+    }
 
-    return inference_artifacts
\ No newline at end of file
+    return inference_artifacts
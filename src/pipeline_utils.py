@@ -0,0 +1,177 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import json
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from torchvision import transforms
+
+from src.model_utils import COCO_LABELS
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iter_image_paths(inputs):
+    """
+    Expands a list of image files, directories and .txt file lists into image paths
+
+    Directories are walked recursively in sorted order. A .txt input is read as one
+    image path per line.
+    """
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif item.endswith(".txt"):
+            with open(item) as f:
+                for line in f:
+                    if line.strip():
+                        yield line.strip()
+        else:
+            yield item
+
+
+def decode_image(img_path, transform=None):
+    """
+    Loads an image from disk as an RGB [C, H, W] tensor in 0-1 range
+    """
+
+    if transform is None:
+        transform = transforms.ToTensor()
+
+    with Image.open(img_path) as img:
+        return transform(img.convert("RGB"))
+
+
+def prefetch(fn, items, num_workers=4, max_prefetch=16):
+    """
+    Applies fn to items on a pool of worker threads, yielding (item, result) pairs
+    in input order while keeping at most max_prefetch results in flight.
+
+    Exceptions raised by fn are yielded in place of the result so that a single bad
+    input does not stop the whole run.
+    """
+
+    def safe_fn(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        in_flight = collections.deque()
+        for item in items:
+            in_flight.append((item, executor.submit(safe_fn, item)))
+            if len(in_flight) >= max_prefetch:
+                item, future = in_flight.popleft()
+                yield item, future.result()
+
+        while in_flight:
+            item, future = in_flight.popleft()
+            yield item, future.result()
+
+
+def detections_to_record(outputs, **fields):
+    """
+    Converts thresholded outputs from predict() to a JSON serializable dict
+    """
+
+    labels = outputs["labels"].tolist()
+    record = dict(fields)
+    record.update(
+        {
+            "boxes": [[round(v, 2) for v in box] for box in outputs["boxes"].tolist()],
+            "scores": [round(v, 4) for v in outputs["scores"].tolist()],
+            "labels": labels,
+            "label_names": [COCO_LABELS[label] for label in labels],
+        }
+    )
+    return record
+
+
+class DetectionWriter(object):
+    """
+    Writes detection records to JSONL, or to Parquet when the path ends in .parquet
+
+    Parquet output requires pyarrow, which is not part of requirements.txt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        self.is_parquet = path.endswith(".parquet")
+
+        if self.is_parquet:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError(
+                    "Writing Parquet requires pyarrow: pip3 install pyarrow"
+                )
+            self._file = None
+        else:
+            self._file = open(path, "w")
+
+    def write(self, record):
+        if self.is_parquet:
+            self.records.append(record)
+        else:
+            self._file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pq.write_table(pa.Table.from_pylist(self.records), self.path)
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,139 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import io
+import copy
+import inspect
+
+import torch
+import torch.nn as nn
+from torchvision.ops.misc import FrozenBatchNorm2d
+
+# FX graph mode quantization is a prototype in torch 1.8 and lives under
+# torch.quantization, later versions keep it there as an alias of torch.ao
+from torch.quantization import get_default_qconfig
+from torch.quantization import quantize_fx
+
+
+def unfreeze_batchnorm(module):
+    """
+    Replaces every FrozenBatchNorm2d in module with an equivalent eval-mode
+    BatchNorm2d, in place, so that quantize_fx recognizes and fuses the
+    conv-bn-relu patterns of the ResNet backbone.
+
+    Returns:
+        module
+    """
+
+    for name, child in module.named_children():
+        if isinstance(child, FrozenBatchNorm2d):
+            bn = nn.BatchNorm2d(child.weight.numel(), eps=child.eps)
+            with torch.no_grad():
+                for key in ["weight", "bias", "running_mean", "running_var"]:
+                    getattr(bn, key).copy_(getattr(child, key))
+            bn.to(child.weight.device)
+            setattr(module, name, bn.eval())
+        else:
+            unfreeze_batchnorm(child)
+    return module
+
+
+def _prepare_fx(module, qconfig, example_input):
+    # torch >= 1.13 requires example inputs, torch 1.8 does not accept them
+    kwargs = {}
+    if "example_inputs" in inspect.signature(quantize_fx.prepare_fx).parameters:
+        kwargs["example_inputs"] = (example_input,)
+    return quantize_fx.prepare_fx(module.eval(), {"": qconfig}, **kwargs)
+
+
+def model_size_bytes(model):
+    """Returns the size of the serialized state dict of model"""
+
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+@torch.no_grad()
+def quantize_retinanet(model, calibration_images, engine="fbgemm"):
+    """
+    Returns an int8 copy of a float RetinaNet, using post-training static
+    quantization calibrated on calibration_images.
+
+    The ResNet body, with its batch norms folded into conv-bn-relu modules, and
+    the four-conv towers of both heads are quantized. The FPN, the final cls_logits
+    and bbox_reg convs, anchors and postprocessing stay in float, which keeps the
+    scores and box offsets at full precision for a small share of the compute.
+
+    Args:
+        model - eval-mode RetinaNet on CPU, left unchanged
+        calibration_images - list of [C, H, W] tensors in 0-1 range, run one at a
+            time through the model to record activation ranges
+        engine - quantized kernel backend, fbgemm for x86 or qnnpack for ARM
+
+    Returns:
+        model (RetinaNet)
+    """
+
+    if not calibration_images:
+        raise ValueError("Static quantization requires at least one calibration image")
+
+    torch.backends.quantized.engine = engine
+    qconfig = get_default_qconfig(engine)
+
+    model = copy.deepcopy(model).eval()
+    model.fused_head = None
+    towers = [model.head.classification_head, model.head.regression_head]
+
+    model.backbone.body = _prepare_fx(
+        unfreeze_batchnorm(model.backbone.body),
+        qconfig,
+        torch.zeros(1, 3, 64, 64),
+    )
+    for tower in towers:
+        channels = tower.conv[0].in_channels
+        tower.conv = _prepare_fx(tower.conv, qconfig, torch.zeros(1, channels, 8, 8))
+
+    for image in calibration_images:
+        model([image])
+
+    model.backbone.body = quantize_fx.convert_fx(model.backbone.body)
+    for tower in towers:
+        tower.conv = quantize_fx.convert_fx(tower.conv)
+    return model
@@ -41,15 +41,18 @@
 # This module is adapted from the original Pytorch torchvision module
 # found at https://github.com/pytorch/vision/blob/master/torchvision/models/detection/retinanet.py
 
+import copy
 import math
+import contextlib
 from collections import OrderedDict
+from typing import Any, Callable
 import warnings
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch import Tensor
-from torch.jit.annotations import Dict, List, Tuple
-from torchvision.models.utils import load_state_dict_from_url
+from torch.jit.annotations import Dict, List, Optional, Tuple
 from torchvision.models.detection import _utils as det_utils
 from torchvision.models.detection.transform import GeneralizedRCNNTransform
 from torchvision.models.detection.backbone_utils import resnet_fpn_backbone
@@ -58,6 +61,7 @@ from torchvision.ops import sigmoid_focal_loss
 from torchvision.ops import boxes as box_ops
 
 from src.anchor_utils import AnchorGenerator
+from src.weight_store import load_weights
 
 
 __all__ = [
@@ -65,6 +69,9 @@ __all__ = [
     "retinanet_resnet50_fpn",
 ]
 
+# intermediate results RetinaNet.forward can keep in viz_artifacts on request
+VIZ_ARTIFACT_KINDS = ("images", "features", "head_outputs", "anchors")
+
 
 def _sum(x: List[Tensor]) -> Tensor:
     res = x[0]
@@ -73,6 +80,73 @@ def _sum(x: List[Tensor]) -> Tensor:
     return res
 
 
+# (min_size, max_size) passed to GeneralizedRCNNTransform for each speed/accuracy
+# preset, max_size keeps the 800 / 1333 ratio of the default
+RESOLUTION_PRESETS = OrderedDict(
+    [
+        ("fast", (512, 853)),
+        ("balanced", (640, 1066)),
+        ("full", (800, 1333)),
+    ]
+)
+
+
+def _inverse_sigmoid(p: float) -> float:
+    """Returns the logit x for which sigmoid(x) == p"""
+    if p <= 0.0:
+        return -math.inf
+    if p >= 1.0:
+        return math.inf
+    return math.log(p / (1.0 - p))
+
+
+def _rank_within_class(labels: Tensor) -> Tensor:
+    """
+    Given labels ordered by descending score, returns the position of each element
+    among the elements sharing its label (0 for the best scoring box of a class).
+    """
+    num = labels.numel()
+    if num == 0:
+        return torch.zeros_like(labels)
+
+    positions = torch.arange(num, device=labels.device)
+    # positions break ties so that this sort is stable without needing stable=True
+    order = torch.argsort(labels * num + positions)
+    sorted_labels = labels[order]
+
+    is_group_start = torch.ones_like(sorted_labels, dtype=torch.bool)
+    is_group_start[1:] = sorted_labels[1:] != sorted_labels[:-1]
+    group_start = torch.cummax(
+        torch.where(is_group_start, positions, torch.zeros_like(positions)), dim=0
+    )[0]
+
+    ranks = torch.empty_like(positions)
+    ranks[order] = positions - group_start
+    return ranks
+
+
+def cpu_autocast_supported():
+    # type: () -> bool
+    """torch.cpu.amp.autocast was added in torch 1.10, the pinned 1.8 lacks it"""
+    return hasattr(getattr(torch, "cpu", None), "amp")
+
+
+def cpu_autocast(dtype):
+    """
+    Returns a context manager running eligible CPU ops (convolutions, matmuls) in
+    dtype, e.g. torch.bfloat16, or a no-op context when dtype is None.
+    """
+    if dtype is None:
+        return contextlib.nullcontext()
+    if not cpu_autocast_supported():
+        raise RuntimeError(
+            "CPU autocast requires torch >= 1.10, found torch {}".format(
+                torch.__version__
+            )
+        )
+    return torch.cpu.amp.autocast(dtype=dtype)
+
+
 class RetinaNetHead(nn.Module):
     """
     A regression and classification head for use in RetinaNet.
@@ -321,6 +395,139 @@ class RetinaNetRegressionHead(nn.Module):
         return torch.cat(all_bbox_regression, dim=1)
 
 
+class FusedRetinaNetHead(nn.Module):
+    """
+    Inference-only execution of a RetinaNetHead with fewer kernel launches and
+    allocations. It computes the same outputs as the head it is built from.
+
+    The first conv of the classification and regression towers reads the same
+    features, so both run as one conv with stacked output channels, and the three
+    convs after it run as one grouped conv (groups=2) per layer. Each level's
+    final logits and box deltas are copied straight into preallocated
+    (N, total_anchors, K) and (N, total_anchors, 4) outputs, replacing the
+    permuted copies and torch.cat of the per-head forward.
+
+    With pack_levels, the listed small pyramid levels (e.g. (2, 3, 4) for P5-P7)
+    are laid out side by side on one canvas separated by a zero column and run through the
+    towers together. The canvas is masked back to zero outside the levels after
+    every layer, so each level sees exactly the zero padding it would see alone.
+
+    The stacked tower weights are copies taken when this module is built, so it
+    must be rebuilt after the head's weights change.
+
+    Arguments:
+        head (RetinaNetHead): head whose weights are used
+        pack_levels (list[int]): indices of the levels to pack together, or None
+    """
+
+    def __init__(self, head, pack_levels=None):
+        super().__init__()
+        cls_head = head.classification_head
+        reg_head = head.regression_head
+
+        cls_convs = [m for m in cls_head.conv.children() if isinstance(m, nn.Conv2d)]
+        reg_convs = [m for m in reg_head.conv.children() if isinstance(m, nn.Conv2d)]
+        for i, (cls_conv, reg_conv) in enumerate(zip(cls_convs, reg_convs)):
+            # non-persistent, so that fusing leaves RetinaNet.state_dict() unchanged
+            self.register_buffer(
+                "weight_{}".format(i),
+                torch.cat([cls_conv.weight, reg_conv.weight]).detach().clone(),
+                persistent=False,
+            )
+            self.register_buffer(
+                "bias_{}".format(i),
+                torch.cat([cls_conv.bias, reg_conv.bias]).detach().clone(),
+                persistent=False,
+            )
+
+        self.num_layers = len(cls_convs)
+        self.in_channels = cls_convs[0].in_channels
+        # held in a tuple so the head's final convs are shared, not registered twice
+        self.final_convs = (cls_head.cls_logits, reg_head.bbox_reg)
+        self.num_classes = cls_head.num_classes
+        self.pack_levels = list(pack_levels) if pack_levels else []
+
+    def _tower(self, x, mask=None):
+        for i in range(self.num_layers):
+            x = F.conv2d(
+                x,
+                getattr(self, "weight_{}".format(i)),
+                getattr(self, "bias_{}".format(i)),
+                padding=1,
+                groups=1 if i == 0 else 2,
+            )
+            x = F.relu_(x)
+            if mask is not None:
+                x = x.mul_(mask)
+        return x
+
+    def _write_outputs(self, x, level_slices, cls_out, reg_out):
+        """Runs the final convs on x and copies each level's region into the outputs"""
+        cls_logits = self.final_convs[0](x[:, : self.in_channels])
+        bbox_regression = self.final_convs[1](x[:, self.in_channels :])
+
+        N = x.shape[0]
+        for start, end, y, x0, H, W in level_slices:
+            for out, level_out, K in [
+                (cls_out, cls_logits, self.num_classes),
+                (reg_out, bbox_regression, 4),
+            ]:
+                # (N, A * K, H, W) -> (N, H, W, A, K), written into (N, HWA, K)
+                level_out = level_out[:, :, y : y + H, x0 : x0 + W]
+                level_out = level_out.view(N, -1, K, H, W).permute(0, 3, 4, 1, 2)
+                out[:, start:end].view(N, H, W, -1, K).copy_(level_out)
+
+    def forward(self, x):
+        # type: (List[Tensor]) -> Dict[str, Tensor]
+        N = x[0].shape[0]
+        num_anchors = self.final_convs[1].out_channels // 4
+
+        offsets = [0]
+        for features in x:
+            offsets.append(
+                offsets[-1] + features.shape[2] * features.shape[3] * num_anchors
+            )
+
+        cls_out = x[0].new_empty((N, offsets[-1], self.num_classes))
+        reg_out = x[0].new_empty((N, offsets[-1], 4))
+
+        packed = [i for i in self.pack_levels if i < len(x)]
+        if len(packed) < 2:
+            packed = []
+
+        for i, features in enumerate(x):
+            if i not in packed:
+                H, W = features.shape[-2:]
+                self._write_outputs(
+                    self._tower(features),
+                    [(offsets[i], offsets[i + 1], 0, 0, H, W)],
+                    cls_out,
+                    reg_out,
+                )
+
+        if packed:
+            # place the packed levels side by side, one zero column apart
+            height = max(x[i].shape[2] for i in packed)
+            width = sum(x[i].shape[3] for i in packed) + len(packed) - 1
+            canvas = x[0].new_zeros((N, x[0].shape[1], height, width))
+            mask = x[0].new_zeros((1, 1, height, width))
+
+            level_slices = []
+            x0 = 0
+            for i in packed:
+                H, W = x[i].shape[-2:]
+                canvas[:, :, :H, x0 : x0 + W] = x[i]
+                mask[:, :, :H, x0 : x0 + W] = 1
+                level_slices.append((offsets[i], offsets[i + 1], 0, x0, H, W))
+                x0 += W + 1
+
+            self._write_outputs(
+                self._tower(canvas, mask), level_slices, cls_out, reg_out
+            )
+
+        return {"cls_logits": cls_out, "bbox_regression": reg_out}
+
+
 class RetinaNet(nn.Module):
     """
     Implements RetinaNet.
@@ -367,6 +574,9 @@ class RetinaNet(nn.Module):
         score_thresh (float): Score threshold used for postprocessing the detections.
         nms_thresh (float): NMS threshold used for postprocessing the detections.
         detections_per_img (int): Number of best detections to keep after NMS.
+        topk_candidates (int): Number of best scoring candidates to keep per feature pyramid level
+            before box decoding and NMS, 1000 as in the paper. None keeps every candidate above
+            score_thresh.
         fg_iou_thresh (float): minimum IoU between the anchor and the GT box so that they can be
             considered as positive during training.
         bg_iou_thresh (float): maximum IoU between the anchor and the GT box so that they can be
@@ -426,6 +636,7 @@ class RetinaNet(nn.Module):
         score_thresh=0.05,
         nms_thresh=0.5,
         detections_per_img=300,
+        topk_candidates=1000,
         nms_off=False,
         fg_iou_thresh=0.5,
         bg_iou_thresh=0.4,
@@ -482,10 +693,219 @@ class RetinaNet(nn.Module):
         self.score_thresh = score_thresh
         self.nms_thresh = nms_thresh
         self.detections_per_img = detections_per_img
+        self.topk_candidates = topk_candidates
+
+        # ARR ADDITION - artifacts are only kept when requested through capture()
+        self.capture_artifacts = ()
+        self.viz_artifacts = {}
+
+        # optional src.instrumentation.Instrumentation timing each forward stage
+        self.instrumentation = None
+
+        # optional FusedRetinaNetHead used instead of self.head in eval mode
+        self.fused_head = None
+
+        # CPU execution mode of the backbone and head, see use_channels_last() and
+        # cpu_autocast(). Anchors and postprocessing always run in fp32
+        self.channels_last = False
+        self.autocast_dtype = None
 
         # used only on torchscript mode
         self._has_warned = False
 
+    def _run_stage(self, stage, fn, *args):
+        """
+        Runs one stage of forward, reporting it to self.instrumentation if one is
+        attached. Without instrumentation this is a plain call.
+        """
+        if self.instrumentation is None:
+            return fn(*args)
+        device = next(self.head.parameters()).device
+        return self.instrumentation.run(stage, fn, *args, device=device)
+
+    def postprocess_artifacts(self, original_image_sizes, nms_off=None, artifacts=None):
+        # type: (List[Tuple[int, int]], Optional[bool], Optional[Dict[str, Any]]) -> List[Dict[str, Tensor]]
+        """
+        Postprocesses the head outputs captured by the last forward pass again,
+        e.g. with nms_off=True to get the pre-NMS boxes of the same images without
+        another backbone and head pass. Requires the "images", "head_outputs" and
+        "anchors" artifacts to have been captured.
+
+        Arguments:
+            original_image_sizes (list[Tuple[int, int]]): (height, width) of the images
+                passed to forward, used to map boxes back to the input resolution
+            nms_off (bool): overrides self.nms_off (optional)
+            artifacts (dict): artifacts filled by forward(..., artifacts=...), defaults
+                to self.viz_artifacts (optional)
+        """
+        if artifacts is None:
+            artifacts = self.viz_artifacts
+        missing = [
+            kind
+            for kind in ["images", "head_outputs", "anchors"]
+            if kind not in artifacts
+        ]
+        if missing:
+            raise ValueError(
+                "postprocess_artifacts needs the {} artifacts, run forward inside "
+                "capture() first".format(missing)
+            )
+
+        images = artifacts["images"]
+        anchor_artifacts = artifacts.get(
+            "anchor_artifacts", self.anchor_generator.anchor_artifacts
+        )
+        num_anchors_per_location = self.anchor_generator.num_anchors_per_location()[0]
+        num_anchors_per_level = [
+            int(h) * int(w) * num_anchors_per_location
+            for h, w in anchor_artifacts["grid_sizes"]
+        ]
+
+        detections = self.postprocess_detections(
+            artifacts["head_outputs"],
+            artifacts["anchors"],
+            images.image_sizes,
+            num_anchors_per_level,
+            nms_off=nms_off,
+        )
+        return self.transform.postprocess(
+            detections, images.image_sizes, original_image_sizes
+        )
+
+    @staticmethod
+    def _check_artifact_kinds(kinds):
+        kinds = tuple(kinds)
+        unknown = [kind for kind in kinds if kind not in VIZ_ARTIFACT_KINDS]
+        if unknown:
+            raise ValueError(
+                "Unknown artifact kinds {}, expected a subset of {}".format(
+                    unknown, VIZ_ARTIFACT_KINDS
+                )
+            )
+        return kinds
+
+    @contextlib.contextmanager
+    def capture(self, kinds=VIZ_ARTIFACT_KINDS):
+        """
+        Context manager that keeps the selected intermediate results of every forward
+        pass in self.viz_artifacts, e.g.
+
+            >>> with model.capture(["features"]):
+            >>>     model(images)
+            >>> features = model.viz_artifacts["features"]
+
+        Artifacts stay on the model until its next forward pass. Outside of this
+        context nothing is kept, so feature maps can be freed between requests.
+
+        Arguments:
+            kinds (list[str]): subset of VIZ_ARTIFACT_KINDS to keep
+        """
+        previous = self.capture_artifacts
+        self.capture_artifacts = self._check_artifact_kinds(kinds)
+        try:
+            yield self.capture_artifacts
+        finally:
+            self.capture_artifacts = previous
+
+    def fuse_head(self, pack_levels=None):
+        """
+        Builds a FusedRetinaNetHead from the current head weights and uses it for
+        every forward pass in eval mode. Call again after loading new weights.
+
+        Arguments:
+            pack_levels (list[int]): levels run together on one canvas, e.g.
+                (2, 3, 4) for P5-P7. None runs every level separately
+        """
+        self.fused_head = FusedRetinaNetHead(self.head, pack_levels)
+        return self.fused_head
+
+    def use_channels_last(self):
+        """
+        Converts the backbone and head weights to the channels_last memory format, in
+        place, and feeds every padded batch to them in that format from then on.
+        Convolutions on CPU run considerably faster in NHWC than in NCHW.
+        """
+        for module in [self.backbone, self.head, self.fused_head]:
+            if module is not None:
+                module.to(memory_format=torch.channels_last)
+        self.channels_last = True
+        return self
+
+    def with_resolution(self, preset):
+        """
+        Returns a variant of this model that resizes its inputs according to one of
+        RESOLUTION_PRESETS, or the model itself when it already does. The variant
+        shares every weight and the anchor generator, whose cache is keyed by grid
+        size, so each preset simply gets its own anchor cache entries.
+
+        Arguments:
+            preset (str): one of "fast", "balanced" or "full"
+        """
+        if preset not in RESOLUTION_PRESETS:
+            raise ValueError(
+                "Unknown resolution preset {}, expected one of {}".format(
+                    preset, list(RESOLUTION_PRESETS)
+                )
+            )
+
+        min_size, max_size = RESOLUTION_PRESETS[preset]
+        if (
+            self.transform.min_size == (min_size,)
+            and self.transform.max_size == max_size
+        ):
+            return self
+
+        variant = copy.copy(self)
+        # copy the submodule dict so that the new transform is not set on self too
+        variant._modules = OrderedDict(self._modules)
+        variant.transform = GeneralizedRCNNTransform(
+            min_size, max_size, self.transform.image_mean, self.transform.image_std
+        )
+        variant.transform.train(self.transform.training)
+        variant.viz_artifacts = {}
+        return variant
+
+    def feature_grid_sizes(self, image_size):
+        # type: (Tuple[int, int]) -> List[List[int]]
+        """
+        Returns the P3-P7 feature map sizes the ResNet-FPN backbone produces for a
+        padded input of image_size, without running the backbone. Every stride-2
+        stage maps a side of length n to ceil(n / 2).
+        """
+        grid_sizes = []
+        height, width = int(image_size[0]), int(image_size[1])
+        for level in range(1, 8):
+            height, width = (height + 1) // 2, (width + 1) // 2
+            if level >= 3:
+                grid_sizes.append([height, width])
+        return grid_sizes
+
+    @torch.no_grad()
+    def precompute_anchors(
+        self, image_shapes, dtype=torch.float32, device=torch.device("cpu")
+    ):
+        """
+        Warms the anchor cache for the declared input shapes, so that the first
+        request of each shape does not pay for anchor generation.
+
+        Arguments:
+            image_shapes (list[Tuple[int, int]]): (height, width) of the raw input
+                images, before GeneralizedRCNNTransform resizes and pads them
+        """
+        was_training = self.transform.training
+        self.transform.eval()
+        try:
+            for height, width in image_shapes:
+                image = torch.zeros(3, height, width, dtype=dtype, device=device)
+                image_size = self.transform([image])[0].tensors.shape[-2:]
+                self.anchor_generator.precompute(
+                    image_size, self.feature_grid_sizes(image_size), dtype, device
+                )
+        finally:
+            self.transform.train(was_training)
+
+        return self.anchor_generator.cache_info()
+
     @torch.jit.unused
     def eager_outputs(self, losses, detections):
         # type: (Dict[str, Tensor], List[Dict[str, Tensor]]) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]
@@ -509,13 +929,136 @@ class RetinaNet(nn.Module):
 
         return self.head.compute_loss(targets, head_outputs, anchors, matched_idxs)
 
-    def postprocess_detections(self, head_outputs, anchors, image_shapes):
+    def postprocess_detections(
+        self,
+        head_outputs,
+        anchors,
+        image_shapes,
+        num_anchors_per_level=None,
+        nms_off=None,
+    ):
+        # type: (Dict[str, Tensor], List[Tensor], List[Tuple[int, int]], Optional[List[int]], Optional[bool]) -> List[Dict[str, Tensor]]
+        """
+        Vectorized postprocessing over the flattened (anchor, class) score matrix.
+
+        Logits are thresholded once for all classes against the inverse sigmoid of
+        score_thresh and capped to the topk_candidates best per pyramid level. Only
+        those candidates go through the sigmoid and are decoded into boxes, which are
+        then suppressed with a single class-aware batched NMS. Detections are returned grouped by class with
+        descending scores, matching postprocess_detections_per_class.
+
+        nms_off overrides self.nms_off for this call, so that the same head outputs
+        can be postprocessed both with and without NMS.
+        """
+
+        class_logits = head_outputs["cls_logits"]
+        box_regression = head_outputs["bbox_regression"]
+        other_outputs = {
+            k: v
+            for k, v in head_outputs.items()
+            if k not in ["cls_logits", "bbox_regression"]
+        }
+
+        num_classes = class_logits.shape[-1]
+        if num_anchors_per_level is None:
+            num_anchors_per_level = [class_logits.shape[1]]
+        if nms_off is None:
+            nms_off = self.nms_off
+
+        # sigmoid is monotonic, so thresholding and ranking logits selects the same
+        # candidates as scores would without applying it to every anchor
+        logit_thresh = _inverse_sigmoid(self.score_thresh)
+
+        detections = torch.jit.annotate(List[Dict[str, Tensor]], [])
+
+        for index, (
+            box_regression_per_image,
+            logits_per_image,
+            anchors_per_image,
+            image_shape,
+        ) in enumerate(zip(box_regression, class_logits, anchors, image_shapes)):
+
+            # threshold every (anchor, class) pair in one pass, level by level
+            candidate_idxs = []
+            level_offset = 0
+            for logits_per_level in logits_per_image.split(num_anchors_per_level):
+                logits_per_level = logits_per_level.flatten()
+                keep_idxs = torch.where(logits_per_level > logit_thresh)[0]
+
+                if self.topk_candidates is not None:
+                    num_topk = min(self.topk_candidates, keep_idxs.size(0))
+                    _, order = logits_per_level[keep_idxs].topk(num_topk)
+                    keep_idxs = keep_idxs[order]
+
+                candidate_idxs.append(keep_idxs + level_offset * num_classes)
+                level_offset += logits_per_level.size(0) // num_classes
+
+            candidate_idxs = torch.cat(candidate_idxs)
+            anchor_idxs = torch.div(candidate_idxs, num_classes, rounding_mode="floor")
+
+            # decode and clip only the boxes of the selected candidates
+            image_boxes = self.box_coder.decode_single(
+                box_regression_per_image[anchor_idxs], anchors_per_image[anchor_idxs]
+            )
+            image_boxes = box_ops.clip_boxes_to_image(image_boxes, image_shape)
+            image_scores = torch.sigmoid(logits_per_image.flatten()[candidate_idxs])
+            image_labels = candidate_idxs % num_classes
+
+            # remove empty boxes
+            keep = box_ops.remove_small_boxes(image_boxes, min_size=1e-2)
+
+            # non-maximum suppression, independently done per class
+            if nms_off:
+                # added by ARR to collect w/o NMS
+                keep = keep[torch.argsort(image_scores[keep], descending=True)]
+                keep = keep[_rank_within_class(image_labels[keep]) < 20]
+            else:
+                keep = keep[
+                    box_ops.batched_nms(
+                        image_boxes[keep],
+                        image_scores[keep],
+                        image_labels[keep],
+                        self.nms_thresh,
+                    )
+                ]
+
+            # keep only topk scoring predictions of each class
+            keep = keep[
+                _rank_within_class(image_labels[keep]) < self.detections_per_img
+            ]
+
+            # group by class, highest score first within each class
+            positions = torch.arange(keep.numel(), device=keep.device)
+            keep = keep[torch.argsort(image_labels[keep] * keep.numel() + positions)]
+
+            detections.append(
+                {
+                    "boxes": image_boxes[keep],
+                    "scores": image_scores[keep],
+                    "labels": image_labels[keep],
+                }
+            )
+
+            for k, v in other_outputs.items():
+                detections[-1].update({k: v[index][anchor_idxs][keep]})
+
+        return detections
+
+    def postprocess_detections_per_class(self, head_outputs, anchors, image_shapes):
         # type: (Dict[str, Tensor], List[Tensor], List[Tuple[int, int]]) -> List[Dict[str, Tensor]]
-        # TODO: Merge this with roi_heads.RoIHeads.postprocess_detections ?
+        """
+        Original torchvision postprocessing that thresholds, filters and runs NMS once
+        per class. Kept as the reference implementation that postprocess_detections
+        is checked and benchmarked against.
+        """
 
-        class_logits = head_outputs.pop("cls_logits")
-        box_regression = head_outputs.pop("bbox_regression")
-        other_outputs = head_outputs
+        class_logits = head_outputs["cls_logits"]
+        box_regression = head_outputs["bbox_regression"]
+        other_outputs = {
+            k: v
+            for k, v in head_outputs.items()
+            if k not in ["cls_logits", "bbox_regression"]
+        }
 
         device = class_logits.device
         num_classes = class_logits.shape[-1]
@@ -614,12 +1157,23 @@ class RetinaNet(nn.Module):
 
         return detections
 
-    def forward(self, images, targets=None):
-        # type: (List[Tensor], Optional[List[Dict[str, Tensor]]]) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]
+    def forward(self, images, targets=None, capture=None, backend=None, artifacts=None):
+        # type: (List[Tensor], Optional[List[Dict[str, Tensor]]], Optional[List[str]], Optional[Callable[[Tensor], Dict[str, Tensor]]], Optional[Dict[str, Any]]) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]
         """
         Arguments:
             images (list[Tensor]): images to be processed
             targets (list[Dict[Tensor]]): ground-truth boxes present in the image (optional)
+            capture (list[str]): artifact kinds to keep in viz_artifacts for this call only,
+                overriding any capture() context (optional)
+            backend (callable): runs the backbone and head in place of this model during
+                inference, taking the padded image batch and returning a dict with
+                cls_logits and bbox_regression, e.g. an OnnxRuntimeBackend. Anchors and
+                postprocessing still run here. The "features" artifact is not available
+                (optional)
+            artifacts (dict): receives the captured artifacts of this call instead of
+                self.viz_artifacts, so that callers sharing one model do not see each
+                other's artifacts. With "anchors" captured it also holds the anchor
+                grid sizes, image size and strides under "anchor_artifacts" (optional)
 
         Returns:
             result (list[BoxList] or dict[Tensor]): the output from the model.
@@ -655,7 +1209,7 @@ class RetinaNet(nn.Module):
             original_image_sizes.append((val[0], val[1]))
 
         # transform the input
-        images, targets = self.transform(images, targets)
+        images, targets = self._run_stage("transform", self.transform, images, targets)
         # Check for degenerate boxes
         # TODO: Move this to a function
         if targets is not None:
@@ -673,27 +1227,91 @@ class RetinaNet(nn.Module):
                         )
                     )
 
-        # get the features from the backbone
-        features = self.backbone(images.tensors)
-
-        if isinstance(features, torch.Tensor):
-            features = OrderedDict([("0", features)])
-
-        # TODO: Do we want a list or a dict?
-        features = list(features.values())
-
-        # compute the retinanet heads outputs using the features
-        head_outputs = self.head(features)
+        if backend is not None and not self.training:
+            # the backend returns the head outputs directly, so the grid sizes come
+            # from the padded input size instead of the feature maps
+            features = []
+            head_outputs = self._run_stage("head", backend, images.tensors)
+            image_size = images.tensors.shape[-2:]
+            grid_sizes = self.feature_grid_sizes(image_size)
+            anchors_per_image = self._run_stage(
+                "anchors",
+                self.anchor_generator.precompute,
+                image_size,
+                grid_sizes,
+                head_outputs["cls_logits"].dtype,
+                head_outputs["cls_logits"].device,
+            )
+            self.anchor_generator.record_artifacts(
+                image_size,
+                grid_sizes,
+                self.anchor_generator.compute_strides(
+                    image_size, grid_sizes, head_outputs["cls_logits"].device
+                ),
+            )
+            anchors = [anchors_per_image for _ in range(len(images.image_sizes))]
+        else:
+            tensors = images.tensors
+            if self.channels_last:
+                tensors = tensors.contiguous(memory_format=torch.channels_last)
+
+            with cpu_autocast(self.autocast_dtype):
+                # get the features from the backbone
+                features = self._run_stage("backbone", self.backbone, tensors)
+
+                if isinstance(features, torch.Tensor):
+                    features = OrderedDict([("0", features)])
+
+                # TODO: Do we want a list or a dict?
+                features = list(features.values())
+
+                # compute the retinanet heads outputs using the features
+                head = self.head
+                if self.fused_head is not None and not self.training:
+                    head = self.fused_head
+                head_outputs = self._run_stage("head", head, features)
+
+            if self.autocast_dtype is not None:
+                # keep anchors, box decoding and NMS in fp32 so boxes do not drift
+                features = [feature.float() for feature in features]
+                head_outputs = {k: v.float() for k, v in head_outputs.items()}
+            grid_sizes = [[x.size(2), x.size(3)] for x in features]
+
+            # create the set of anchors
+            anchors = self._run_stage(
+                "anchors", self.anchor_generator, images, features
+            )
 
-        # create the set of anchors
-        anchors = self.anchor_generator(images, features)
+        num_anchors_per_level = [
+            h * w * self.anchor_generator.num_anchors_per_location()[0]
+            for h, w in grid_sizes
+        ]
 
-        # ARR ADDITION - collect artifacts to visualize
-        self.viz_artifacts = {}
-        self.viz_artifacts["images"] = images
-        self.viz_artifacts["features"] = features.copy()
-        self.viz_artifacts["head_outputs"] = head_outputs.copy()
-        self.viz_artifacts["anchors"] = anchors.copy()
+        # ARR ADDITION - collect the requested artifacts to visualize
+        if capture is None:
+            capture = self.capture_artifacts
+        else:
+            capture = self._check_artifact_kinds(capture)
+
+        if artifacts is None:
+            self.viz_artifacts = {}
+            artifacts = self.viz_artifacts
+        if "images" in capture:
+            artifacts["images"] = images
+        if "features" in capture:
+            artifacts["features"] = features.copy()
+        if "head_outputs" in capture:
+            artifacts["head_outputs"] = head_outputs.copy()
+        if "anchors" in capture:
+            artifacts["anchors"] = anchors.copy()
+            image_size = images.tensors.shape[-2:]
+            artifacts["anchor_artifacts"] = {
+                "grid_sizes": grid_sizes,
+                "image_size": image_size,
+                "strides": self.anchor_generator.compute_strides(
+                    image_size, grid_sizes, images.tensors.device
+                ),
+            }
 
         losses = {}
         detections = torch.jit.annotate(List[Dict[str, Tensor]], [])
@@ -704,11 +1322,20 @@ class RetinaNet(nn.Module):
             losses = self.compute_loss(targets, head_outputs, anchors)
         else:
             # compute the detections
-            detections = self.postprocess_detections(
-                head_outputs, anchors, images.image_sizes
+            detections = self._run_stage(
+                "postprocess",
+                self.postprocess_detections,
+                head_outputs,
+                anchors,
+                images.image_sizes,
+                num_anchors_per_level,
             )
-            detections = self.transform.postprocess(
-                detections, images.image_sizes, original_image_sizes
+            detections = self._run_stage(
+                "transform_postprocess",
+                self.transform.postprocess,
+                detections,
+                images.image_sizes,
+                original_image_sizes,
             )
 
         if torch.jit.is_scripting():
@@ -727,7 +1354,12 @@ model_urls = {
 
 
 def retinanet_resnet50_fpn(
-    pretrained=False, progress=True, num_classes=91, pretrained_backbone=True, **kwargs
+    pretrained=False,
+    progress=True,
+    num_classes=91,
+    pretrained_backbone=True,
+    weights_dir=None,
+    **kwargs
 ):
     """
     Constructs a RetinaNet model with a ResNet-50-FPN backbone.
@@ -764,6 +1396,8 @@ def retinanet_resnet50_fpn(
     Arguments:
         pretrained (bool): If True, returns a model pre-trained on COCO train2017
         progress (bool): If True, displays a progress bar of the download to stderr
+        weights_dir (str): directory holding local, checksummed copies of the COCO weights.
+            Defaults to $RETINANET_WEIGHTS_DIR or ./models, see src/weight_store.py
     """
     if pretrained:
         # no need to download the backbone if pretrained is set
@@ -777,8 +1411,10 @@ def retinanet_resnet50_fpn(
     )
     model = RetinaNet(backbone, num_classes, **kwargs)
     if pretrained:
-        state_dict = load_state_dict_from_url(
-            model_urls["retinanet_resnet50_fpn_coco"], progress=progress
+        model.load_info = load_weights(
+            model,
+            model_urls["retinanet_resnet50_fpn_coco"],
+            weights_dir=weights_dir,
+            progress=progress,
         )
-        model.load_state_dict(state_dict)
     return model
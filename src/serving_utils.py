@@ -0,0 +1,324 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import io
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+from torchvision import transforms
+
+from src.model_utils import predict_batch, threshold_outputs
+from src.pipeline_utils import detections_to_record
+
+
+class DynamicBatcher(object):
+    """
+    Merges concurrently submitted items into micro-batches for a batch function.
+
+    A single worker thread waits for the first queued item, then keeps collecting
+    until max_batch_size items are gathered or max_wait_ms has passed since that
+    first item arrived. The batch function receives a list of items and must
+    return a list of results in the same order, which are fanned back out to the
+    Future returned by each submit() call. Items still queued when the batcher
+    stops, or left without a result by batch_fn, fail with a RuntimeError.
+
+    Args:
+        batch_fn - callable mapping a list of items to a list of results
+        max_batch_size - largest number of items passed to batch_fn at once
+        max_wait_ms - longest time the first item of a batch waits for company
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=10):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        # orders submit() against stop(), so nothing is queued after the sentinel
+        self._submit_lock = threading.Lock()
+
+        self.num_batches = 0
+        self.num_items = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            with self._submit_lock:
+                self._stopped.set()
+                self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        # fail whatever the worker did not get to before it stopped
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].set_exception(
+                    RuntimeError("batcher stopped before the item was processed")
+                )
+
+    def submit(self, item):
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                future.set_exception(RuntimeError("batcher is stopped"))
+            else:
+                self._queue.put((item, future))
+        return future
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._stopped.set()
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            if len(results) != len(batch):
+                error = RuntimeError(
+                    f"batch function returned {len(results)} results for "
+                    f"{len(batch)} items"
+                )
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+
+            self.num_batches += 1
+            self.num_items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.num_batches,
+            "items": self.num_items,
+            "mean_batch_size": self.num_items / max(1, self.num_batches),
+            "queued": self._queue.qsize(),
+        }
+
+
+def make_predict_batch_fn(model, batch_size):
+    """
+    Returns a batch function over (image, detection_threshold) pairs that runs one
+    predict_batch call at the lowest requested threshold, then applies each
+    request's own threshold to its outputs
+    """
+
+    transform = transforms.Compose([transforms.ToTensor()])
+
+    def predict_fn(items):
+        images = [image for image, _ in items]
+        thresholds = [threshold for _, threshold in items]
+        outputs = predict_batch(
+            model, images, transform, min(thresholds), batch_size=batch_size
+        )
+        return [
+            threshold_outputs(image_outputs, threshold)
+            for image_outputs, threshold in zip(outputs, thresholds)
+        ]
+
+    return predict_fn
+
+
+class DetectionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with raw image bytes as the body, optionally ?threshold=0.5,
+    returns detections as JSON. GET /health returns batching statistics.
+    """
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(
+                200, {"status": "ok", "batcher": self.server.batcher.stats()}
+            )
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            threshold = float(
+                parse_qs(url.query).get("threshold", [self.server.detection_threshold])[
+                    0
+                ]
+            )
+            length = int(self.headers.get("Content-Length", 0))
+            image = Image.open(io.BytesIO(self.rfile.read(length))).convert("RGB")
+        except Exception as e:
+            self._send_json(400, {"error": f"could not read request: {e}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            outputs = self.server.batcher.submit((image, threshold)).result(
+                timeout=self.server.request_timeout_s
+            )
+        except TimeoutError:
+            self._send_json(
+                504,
+                {"error": f"no result within {self.server.request_timeout_s}s"},
+            )
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+
+        record = detections_to_record(
+            outputs,
+            width=image.width,
+            height=image.height,
+            latency_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+        self._send_json(200, record)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class DetectionServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server whose request threads share one DynamicBatcher, so that
+    concurrent requests are merged into batched forward passes
+
+    Args:
+        model - Pytorch detection model
+        host, port - address to bind, port 0 picks a free port
+        max_batch_size, max_wait_ms - see DynamicBatcher
+        detection_threshold - default confidence score for predictions to be kept
+        quiet - disables per-request logging
+        request_timeout_s - longest time a request waits for its detections before
+            the server answers 504
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        model,
+        host="127.0.0.1",
+        port=8080,
+        max_batch_size=8,
+        max_wait_ms=10,
+        detection_threshold=0.7,
+        quiet=False,
+        request_timeout_s=60,
+    ):
+        super().__init__((host, port), DetectionRequestHandler)
+        self.detection_threshold = detection_threshold
+        self.quiet = quiet
+        self.request_timeout_s = request_timeout_s
+        self.batcher = DynamicBatcher(
+            make_predict_batch_fn(model, max_batch_size),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+        ).start()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_in_background(self):
+        """Starts serve_forever() on a daemon thread, e.g. for local tests"""
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.stop()
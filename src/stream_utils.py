@@ -0,0 +1,322 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import queue
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+from src.model_utils import predict_batch
+from src.pipeline_utils import iter_image_paths
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+
+def _iter_cv2_frames(cv2, path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError(f"could not open video {path}")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index / fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        capture.release()
+
+
+def _iter_av_frames(av, path):
+    with av.open(path) as container:
+        for frame in container.decode(video=0):
+            yield float(frame.time or 0.0), frame.to_ndarray(format="rgb24")
+
+
+def iter_video_frames(path):
+    """
+    Decodes a video file into (timestamp_s, frame) pairs, where frame is an RGB
+    uint8 array of shape [H, W, 3]
+
+    Decoding uses opencv-python, or PyAV when OpenCV is not installed. Neither is
+    part of requirements.txt.
+    """
+
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+
+    if cv2 is not None:
+        return _iter_cv2_frames(cv2, path)
+
+    try:
+        import av
+    except ImportError:
+        raise ImportError(
+            "Decoding video requires opencv-python or av: pip3 install opencv-python"
+        )
+    return _iter_av_frames(av, path)
+
+
+def iter_image_sequence(inputs, fps=30.0):
+    """
+    Reads image files, directories or .txt file lists as a frame sequence of
+    (timestamp_s, frame) pairs, with frames spaced 1 / fps seconds apart
+    """
+
+    for index, img_path in enumerate(iter_image_paths(inputs)):
+        with Image.open(img_path) as img:
+            # np.array rather than np.asarray: PIL hands out read-only buffers
+            yield index / fps, np.array(img.convert("RGB"))
+
+
+def iter_frames(source, fps=None):
+    """
+    Returns (timestamp_s, frame) pairs from a video file when source has a video
+    extension, and from an image sequence otherwise. fps only applies to image
+    sequences, videos use their own timestamps.
+    """
+
+    if isinstance(source, str) and source.lower().endswith(VIDEO_EXTENSIONS):
+        return iter_video_frames(source)
+
+    inputs = [source] if isinstance(source, str) else source
+    return iter_image_sequence(inputs, fps=fps or 30.0)
+
+
+class FrameReader(object):
+    """
+    Decodes frames on a background thread into a queue holding at most max_queue
+    frames, so decoding runs ahead of inference without unbounded memory use.
+
+    Args:
+        frames - iterable of (timestamp_s, frame) pairs, e.g. from iter_frames()
+        max_queue - maximum number of decoded frames waiting for inference
+    """
+
+    _END = object()
+
+    def __init__(self, frames, max_queue=16):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(frames,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # time out regularly so that close() can stop a reader blocked on a full queue
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, frames):
+        try:
+            for item in frames:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put(e)
+        self._put(self._END)
+
+    def get_batch(self, batch_size):
+        """
+        Blocks for the next frame, then adds the frames that are already decoded
+        up to batch_size, so a slow source is never held back to fill a batch.
+
+        Returns:
+            batch (list) - (timestamp_s, frame) pairs, empty once the source is done
+        """
+
+        batch = []
+        while not self._finished and len(batch) < batch_size:
+            try:
+                item = self.queue.get(block=not batch)
+            except queue.Empty:
+                break
+
+            if item is self._END:
+                self._finished = True
+            elif isinstance(item, Exception):
+                self._finished = True
+                raise item
+            else:
+                batch.append(item)
+        return batch
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _writable(frame):
+    # torch.from_numpy warns on read-only arrays, copy only those
+    return frame if frame.flags.writeable else np.array(frame)
+
+
+def frame_to_tensor(frame, dtype=torch.float32, device="cpu"):
+    """Converts an RGB uint8 [H, W, 3] frame into a [3, H, W] tensor in 0-1 range"""
+
+    return (
+        torch.from_numpy(_writable(frame))
+        .permute(2, 0, 1)
+        .to(device=device, dtype=dtype)
+        .div_(255)
+    )
+
+
+class FrameBuffer(object):
+    """
+    Preallocated [batch_size, 3, H, W] model input for frames of one fixed size.
+    fill() converts uint8 frames into it in place, so a static camera stream
+    allocates no new input tensors once running.
+    """
+
+    def __init__(self, batch_size, height, width, dtype=torch.float32, device="cpu"):
+        self.tensor = torch.empty(
+            batch_size, 3, height, width, dtype=dtype, device=device
+        )
+
+    def fits(self, frame):
+        return tuple(frame.shape[:2]) == tuple(self.tensor.shape[-2:])
+
+    def fill(self, frames):
+        """Returns [3, H, W] views of the buffer holding frames in 0-1 range"""
+
+        inputs = self.tensor[: len(frames)]
+        for input, frame in zip(inputs, frames):
+            input.copy_(torch.from_numpy(_writable(frame)).permute(2, 0, 1))
+        inputs.div_(255)
+        return list(inputs)
+
+
+def stream_detections(
+    model,
+    source,
+    batch_size=4,
+    detection_threshold=0.7,
+    max_queue=16,
+    static_camera=False,
+    preset=None,
+    fps=None,
+    return_frames=False,
+):
+    """
+    Runs batched detection over a video file or image sequence, yielding one
+    result per frame as soon as its batch is done.
+
+    Frames are decoded ahead on a background thread into a bounded queue. With
+    static_camera=True every frame is assumed to share one size: its anchors are
+    precomputed once and frames are copied into a reused FrameBuffer instead of
+    new tensors, keeping steady-state allocation on the input side near zero.
+    A change of frame size simply reallocates the buffer.
+
+    Args:
+        model - RetinaNet, e.g. from src.model_registry.get_model()
+        source - video path, or image files / directories / .txt lists
+        batch_size - maximum number of frames per forward pass
+        detection_threshold - confidence score for predictions to be kept
+        max_queue - maximum number of decoded frames waiting for inference
+        static_camera - reuse one input buffer and warm the anchor cache
+        preset - optional resolution preset ("fast", "balanced" or "full")
+        fps - frame rate used for the timestamps of image sequences
+        return_frames - include the decoded RGB frame in each result
+
+    Yields:
+        result (dict) - frame_index, timestamp_s and outputs (boxes, scores, labels)
+    """
+
+    if model.training:
+        model.eval()
+    if preset is not None:
+        model = model.with_resolution(preset)
+
+    param = next(model.parameters())
+    reader = FrameReader(iter_frames(source, fps=fps), max_queue=max_queue)
+    buffer = None
+    frame_index = 0
+
+    try:
+        while True:
+            batch = reader.get_batch(batch_size)
+            if not batch:
+                break
+
+            frames = [frame for _, frame in batch]
+            if static_camera and (buffer is None or not buffer.fits(frames[0])):
+                buffer = FrameBuffer(
+                    batch_size, *frames[0].shape[:2], param.dtype, param.device
+                )
+                model.precompute_anchors(
+                    [frames[0].shape[:2]], param.dtype, param.device
+                )
+
+            if static_camera and all(buffer.fits(frame) for frame in frames):
+                tensors = buffer.fill(frames)
+            else:
+                tensors = [
+                    frame_to_tensor(frame, param.dtype, param.device)
+                    for frame in frames
+                ]
+
+            outputs = predict_batch(
+                model, tensors, None, detection_threshold, batch_size=batch_size
+            )
+
+            for (timestamp, frame), frame_outputs in zip(batch, outputs):
+                result = {
+                    "frame_index": frame_index,
+                    "timestamp_s": timestamp,
+                    "outputs": frame_outputs,
+                }
+                if return_frames:
+                    result["frame"] = frame
+                yield result
+                frame_index += 1
+    finally:
+        reader.close()
@@ -0,0 +1,315 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+import os
+import json
+import time
+import struct
+import hashlib
+import warnings
+
+import numpy as np
+import torch
+from torch import nn
+from torchvision.models.utils import load_state_dict_from_url
+
+# directory searched for local weights when no weights_dir is passed
+WEIGHTS_DIR_ENV = "RETINANET_WEIGHTS_DIR"
+DEFAULT_WEIGHTS_DIR = "models"
+
+# set to 1 on hosts without outbound network to never fall back to downloading
+OFFLINE_ENV = "RETINANET_OFFLINE"
+
+# dtype names follow the safetensors specification so that files written here
+# can also be read by the safetensors library
+_DTYPES = {
+    "F64": (torch.float64, np.float64),
+    "F32": (torch.float32, np.float32),
+    "F16": (torch.float16, np.float16),
+    "I64": (torch.int64, np.int64),
+    "I32": (torch.int32, np.int32),
+    "I16": (torch.int16, np.int16),
+    "I8": (torch.int8, np.int8),
+    "U8": (torch.uint8, np.uint8),
+    "BOOL": (torch.bool, np.bool_),
+}
+_DTYPE_NAMES = {torch_dtype: name for name, (torch_dtype, _) in _DTYPES.items()}
+
+
+def get_weights_dir(weights_dir=None):
+    """Resolves the local weight directory from the argument or the environment"""
+
+    if weights_dir is None:
+        weights_dir = os.environ.get(WEIGHTS_DIR_ENV, DEFAULT_WEIGHTS_DIR)
+    return weights_dir
+
+
+def file_sha256(path, chunk_size=2**20):
+    """Streams a file through sha256 and returns the hex digest"""
+
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def expected_sha256(path):
+    """
+    Returns the checksum a weight file is expected to have, or None if unknown.
+
+    A <file>.sha256 sidecar holding the full digest takes priority. Otherwise the
+    torchvision naming convention <name>-<sha256 prefix>.pth provides a prefix
+    for checkpoints in their original format.
+    """
+
+    sidecar = f"{path}.sha256"
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            return f.read().split()[0].strip()
+
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if ext == ".pth" and "-" in stem:
+        return stem.rsplit("-", 1)[-1]
+
+    return None
+
+
+def verify_checksum(path):
+    """
+    Raises a RuntimeError if the file's sha256 does not match its expected checksum
+    """
+
+    expected = expected_sha256(path)
+    if expected is None:
+        raise RuntimeError(
+            f"No checksum found for {path}. Add a {os.path.basename(path)}.sha256 "
+            "file next to it or pass verify=False."
+        )
+
+    digest = file_sha256(path)
+    if not digest.startswith(expected):
+        raise RuntimeError(
+            f"Checksum mismatch for {path}: expected {expected}, got {digest}"
+        )
+
+    return digest
+
+
+def save_safetensors(state_dict, path, metadata=None):
+    """
+    Writes a state dict in the safetensors layout: an 8 byte little-endian header
+    length, a JSON header mapping each name to its dtype, shape and byte range,
+    then the raw tensor bytes. A <file>.sha256 sidecar is written alongside.
+    """
+
+    # larger dtypes first keeps every tensor aligned to its element size
+    names = sorted(
+        state_dict, key=lambda name: (-state_dict[name].element_size(), name)
+    )
+
+    header = {}
+    offset = 0
+    for name in names:
+        tensor = state_dict[name]
+        num_bytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": _DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + num_bytes],
+        }
+        offset += num_bytes
+    if metadata:
+        header["__metadata__"] = {k: str(v) for k, v in metadata.items()}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # pad the header with spaces so the data buffer starts 8 byte aligned
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 8)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            f.write(state_dict[name].detach().cpu().contiguous().numpy().tobytes())
+
+    with open(f"{path}.sha256", "w") as f:
+        f.write(f"{file_sha256(path)}  {os.path.basename(path)}\n")
+
+
+def load_safetensors(path):
+    """
+    Memory-maps a safetensors file and returns a state dict whose tensors are views
+    onto the mapped pages. The mapping is copy-on-write, so nothing is read from
+    disk until a tensor is used and the file itself is never modified.
+    """
+
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+
+    data_start = 8 + header_size
+    buffer = np.memmap(path, dtype=np.uint8, mode="c")
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+
+        _, np_dtype = _DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        array = buffer[data_start + begin : data_start + end]
+
+        if (data_start + begin) % np.dtype(np_dtype).itemsize:
+            # misaligned tensors (written by other tools) have to be copied
+            array = np.frombuffer(array.tobytes(), dtype=np_dtype)
+        else:
+            array = array.view(np_dtype)
+
+        state_dict[name] = torch.from_numpy(array.reshape(info["shape"]))
+
+    return state_dict
+
+
+def assign_state_dict(model, state_dict):
+    """
+    Points the model's parameters and buffers at the tensors of state_dict instead
+    of copying into them, so memory-mapped weights stay zero-copy. Parameters are
+    created with requires_grad=False as the result is meant for inference.
+    """
+
+    expected = set(model.state_dict().keys())
+    missing = sorted(expected - set(state_dict))
+    unexpected = sorted(
+        k for k in set(state_dict) - expected if not k.endswith("num_batches_tracked")
+    )
+    if missing or unexpected:
+        raise RuntimeError(
+            f"Error assigning state_dict: missing keys {missing}, "
+            f"unexpected keys {unexpected}"
+        )
+
+    for name in expected:
+        module_name, _, attr = name.rpartition(".")
+        module = model
+        for child in module_name.split(".") if module_name else []:
+            module = getattr(module, child)
+        tensor = state_dict[name]
+
+        if attr in module._parameters:
+            current = module._parameters[attr]
+            if current.shape != tensor.shape:
+                raise RuntimeError(
+                    f"size mismatch for {name}: expected {tuple(current.shape)}, "
+                    f"got {tuple(tensor.shape)}"
+                )
+            module._parameters[attr] = nn.Parameter(
+                tensor.to(current.dtype), requires_grad=False
+            )
+        else:
+            module._buffers[attr] = tensor.to(module._buffers[attr].dtype)
+
+    return model
+
+
+def resolve_weights(url, weights_dir=None):
+    """
+    Returns the path of a local copy of the weights behind url, preferring the
+    memory-mappable .safetensors file over the original .pth, or None.
+    """
+
+    weights_dir = get_weights_dir(weights_dir)
+    filename = os.path.basename(url)
+    stem = os.path.splitext(filename)[0]
+
+    for candidate in [f"{stem}.safetensors", filename]:
+        path = os.path.join(weights_dir, candidate)
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def load_weights(model, url, weights_dir=None, verify=True, progress=True):
+    """
+    Loads pretrained weights into model from the local weight store, falling back
+    to downloading from url unless RETINANET_OFFLINE=1 is set.
+
+    Args:
+        model - nn.Module to load the weights into
+        url - torchvision download url, whose filename names the local file
+        weights_dir - directory holding local weights, see get_weights_dir()
+        verify - check the local file's sha256 before loading it
+        progress - show a progress bar when downloading
+
+    Returns:
+        load_info - dict with the weight path, format and startup timings
+    """
+
+    start = time.perf_counter()
+    path = resolve_weights(url, weights_dir)
+    load_info = {"path": path, "verify_s": 0.0}
+
+    if path is None:
+        if os.environ.get(OFFLINE_ENV) == "1":
+            raise FileNotFoundError(
+                f"No local copy of {os.path.basename(url)} in "
+                f"{get_weights_dir(weights_dir)} and {OFFLINE_ENV}=1 is set. Run "
+                "scripts/prepare_weights.py on a machine with network access and "
+                "copy the output directory over."
+            )
+        state_dict = load_state_dict_from_url(url, progress=progress, check_hash=True)
+        load_info.update({"path": url, "format": "download"})
+        model.load_state_dict(state_dict)
+    else:
+        if verify:
+            verify_start = time.perf_counter()
+            verify_checksum(path)
+            load_info["verify_s"] = time.perf_counter() - verify_start
+        else:
+            warnings.warn(f"Loading {path} without checksum verification")
+
+        if path.endswith(".safetensors"):
+            load_info["format"] = "safetensors"
+            assign_state_dict(model, load_safetensors(path))
+        else:
+            load_info["format"] = "pth"
+            model.load_state_dict(torch.load(path, map_location="cpu"))
+
+    load_info["load_s"] = time.perf_counter() - start
+    return load_info
@@ -0,0 +1,121 @@
+# ###########################################################################
+#
+#  CLOUDERA APPLIED MACHINE LEARNING PROTOTYPE (AMP)
+#  (C) Cloudera, Inc. 2021
+#  All rights reserved.
+#
+#  Applicable Open Source License: Apache 2.0
+#
+#  NOTE: Cloudera open source products are modular software products
+#  made up of hundreds of individual components, each of which was
+#  individually copyrighted.  Each Cloudera open source product is a
+#  collective work under U.S. Copyright Law. Your license to use the
+#  collective work is as provided in your written agreement with
+#  Cloudera.  Used apart from the collective work, this file is
+#  licensed for your use pursuant to the open source license
+#  identified above.
+#
+#  This code is provided to you pursuant a written agreement with
+#  (i) Cloudera, Inc. or (ii) a third-party authorized to distribute
+#  this code. If you do not have a written agreement with Cloudera nor
+#  with an authorized and properly licensed third party, you do not
+#  have any rights to access nor to use this code.
+#
+#  Absent a written agreement with Cloudera, Inc. (“Cloudera”) to the
+#  contrary, A) CLOUDERA PROVIDES THIS CODE TO YOU WITHOUT WARRANTIES OF ANY
+#  KIND; (B) CLOUDERA DISCLAIMS ANY AND ALL EXPRESS AND IMPLIED
+#  WARRANTIES WITH RESPECT TO THIS CODE, INCLUDING BUT NOT LIMITED TO
+#  IMPLIED WARRANTIES OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY AND
+#  FITNESS FOR A PARTICULAR PURPOSE; (C) CLOUDERA IS NOT LIABLE TO YOU,
+#  AND WILL NOT DEFEND, INDEMNIFY, NOR HOLD YOU HARMLESS FOR ANY CLAIMS
+#  ARISING FROM OR RELATED TO THE CODE; AND (D)WITH RESPECT TO YOUR EXERCISE
+#  OF ANY RIGHTS GRANTED TO YOU FOR THE CODE, CLOUDERA IS NOT LIABLE FOR ANY
+#  DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, PUNITIVE OR
+#  CONSEQUENTIAL DAMAGES INCLUDING, BUT NOT LIMITED TO, DAMAGES
+#  RELATED TO LOST REVENUE, LOST PROFITS, LOSS OF INCOME, LOSS OF
+#  BUSINESS ADVANTAGE OR UNAVAILABILITY, OR LOSS OR CORRUPTION OF
+#  DATA.
+#
+
+"""
+Tests for src/serving_utils.py: failure handling of DynamicBatcher, and a
+localhost end-to-end request against DetectionServer with untrained weights.
+
+Run from the root directory of the repo:
+
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import json
+import unittest
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.retinanet import retinanet_resnet50_fpn
+from src.serving_utils import DynamicBatcher, DetectionServer
+
+
+class DynamicBatcherTest(unittest.TestCase):
+    def test_results_are_fanned_out_in_order(self):
+        batcher = DynamicBatcher(lambda items: [2 * i for i in items]).start()
+        try:
+            futures = [batcher.submit(i) for i in range(5)]
+            self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8])
+        finally:
+            batcher.stop()
+
+    def test_missing_results_fail_every_item(self):
+        batcher = DynamicBatcher(lambda items: items[:-1], max_wait_ms=50).start()
+        try:
+            futures = [batcher.submit(i) for i in range(3)]
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result(timeout=5)
+        finally:
+            batcher.stop()
+
+    def test_stop_fails_pending_and_later_items(self):
+        batcher = DynamicBatcher(lambda items: items)
+        pending = batcher.submit(1)
+        batcher.start()
+        batcher.stop()
+        # the item was either processed or failed, but never left hanging
+        self.assertTrue(pending.done())
+        with self.assertRaises(RuntimeError):
+            batcher.submit(2).result(timeout=5)
+
+
+class DetectionServerTest(unittest.TestCase):
+    def test_predict_over_localhost(self):
+        model = retinanet_resnet50_fpn(
+            pretrained=False, pretrained_backbone=False, min_size=320, max_size=480
+        ).eval()
+        server = DetectionServer(model, port=0, quiet=True, request_timeout_s=120)
+        server.serve_in_background()
+        try:
+            with open("data/giraffe/giraffe.jpg", "rb") as f:
+                request = urllib.request.Request(
+                    f"{server.url}/predict?threshold=0.0", data=f.read()
+                )
+            with urllib.request.urlopen(request, timeout=120) as response:
+                self.assertEqual(response.status, 200)
+                record = json.loads(response.read())
+
+            self.assertEqual((record["width"], record["height"]), (640, 427))
+            for key in ["boxes", "scores", "labels"]:
+                self.assertIn(key, record)
+            self.assertEqual(len(record["boxes"]), len(record["scores"]))
+
+            with urllib.request.urlopen(f"{server.url}/health", timeout=10) as response:
+                health = json.loads(response.read())
+            self.assertEqual(health["batcher"]["items"], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()